@@ -0,0 +1,256 @@
+"""Pure board rules for Tile Merger, shared by the game and its offline tools.
+
+Boards are flat row-major tuples of GRID_SIZE * GRID_SIZE tile values (0 for
+an empty cell). Nothing here imports pygame, so the puzzle generator and the
+playout workers can use the rules without starting SDL.
+"""
+import hashlib
+import random
+import time
+
+GRID_SIZE = 4
+
+# Board symmetries
+# Each symmetry maps (row, col) to a new (row, col)
+SYMMETRIES = {
+    "identity":       lambda r, c: (r, c),
+    "rotate_90":      lambda r, c: (c, GRID_SIZE - 1 - r),
+    "rotate_180":     lambda r, c: (GRID_SIZE - 1 - r, GRID_SIZE - 1 - c),
+    "rotate_270":     lambda r, c: (GRID_SIZE - 1 - c, r),
+    "mirror":         lambda r, c: (r, GRID_SIZE - 1 - c),
+    "flip":           lambda r, c: (GRID_SIZE - 1 - r, c),
+    "transpose":      lambda r, c: (c, r),
+    "anti_transpose": lambda r, c: (GRID_SIZE - 1 - c, GRID_SIZE - 1 - r),
+}
+
+# New tiles spawn in the top row, so only symmetries that keep the top row
+# on top give positions that play out the same way
+SPAWN_PRESERVING_SYMMETRIES = ("identity", "mirror")
+
+# For each symmetry, the destination index of every source cell index
+SYMMETRY_PERMUTATIONS = {
+    name: tuple(dest_r * GRID_SIZE + dest_c
+                for r in range(GRID_SIZE) for c in range(GRID_SIZE)
+                for dest_r, dest_c in [transform(r, c)])
+    for name, transform in SYMMETRIES.items()
+}
+
+def transform_board(board, symmetry):
+    """Return the board with the named symmetry applied"""
+    permutation = SYMMETRY_PERMUTATIONS[symmetry]
+    result = [0] * len(board)
+    for index, value in enumerate(board):
+        result[permutation[index]] = value
+    return tuple(result)
+
+def canonical_symmetry(board, spawn_preserving=False):
+    """Name of a symmetry that turns the board into its canonical_board"""
+    symmetries = SPAWN_PRESERVING_SYMMETRIES if spawn_preserving else SYMMETRIES
+    return min(symmetries, key=lambda name: transform_board(board, name))
+
+def canonical_board(board, spawn_preserving=False):
+    """Return the smallest equivalent board under the allowed symmetries
+
+    This is the one canonical form: canonical hashes are hashes of it.
+    """
+    return transform_board(board, canonical_symmetry(board, spawn_preserving))
+
+# Zobrist keys: one per (cell index, power of 2 tile value), drawn up front in
+# a fixed order from a private generator so that every process gets the same
+# table and hashing never disturbs the gameplay random state
+ZOBRIST_MAX_EXPONENT = 32  # Tiles up to 2**32 have a precomputed key
+_zobrist_random = random.Random(2048)
+_zobrist_keys = {(index, 1 << exponent): _zobrist_random.getrandbits(64)
+                 for index in range(GRID_SIZE * GRID_SIZE)
+                 for exponent in range(1, ZOBRIST_MAX_EXPONENT + 1)}
+
+def zobrist_key(index, value):
+    """Return the 64-bit key for a tile value sitting at a cell index"""
+    key = _zobrist_keys.get((index, value))
+    if key is None:
+        # Off the table: derive the key from the pair itself so it is still
+        # the same in every process
+        digest = hashlib.blake2b(b"%d:%d" % (index, value), digest_size=8).digest()
+        key = int.from_bytes(digest, "little")
+    return key
+
+class PositionHasher:
+    """Incrementally maintained Zobrist hashes of a board and its symmetric images"""
+
+    def __init__(self):
+        self.hashes = dict.fromkeys(SYMMETRIES, 0)
+
+    def reset(self):
+        """Forget all tiles (empty board)"""
+        self.hashes = dict.fromkeys(SYMMETRIES, 0)
+
+    def toggle(self, row, col, value):
+        """Add or remove a tile value at (row, col) - XOR is its own inverse"""
+        index = row * GRID_SIZE + col
+        for name, permutation in SYMMETRY_PERMUTATIONS.items():
+            self.hashes[name] ^= zobrist_key(permutation[index], value)
+
+    def update(self, row, col, old_value, new_value):
+        """Replace the value at (row, col); 0 or None means empty"""
+        if old_value:
+            self.toggle(row, col, old_value)
+        if new_value:
+            self.toggle(row, col, new_value)
+
+    @property
+    def hash(self):
+        """Hash of the board as it stands"""
+        return self.hashes["identity"]
+
+    def canonical_hash(self, board, spawn_preserving=False):
+        """canonical_hash(board) read from the maintained symmetric images
+
+        board must be the position being tracked; it only decides which
+        image is the canonical one.
+        """
+        return self.hashes[canonical_symmetry(board, spawn_preserving)]
+
+def board_hash(board):
+    """Compute the Zobrist hash of a board from scratch"""
+    result = 0
+    for index, value in enumerate(board):
+        if value:
+            result ^= zobrist_key(index, value)
+    return result
+
+def canonical_hash(board, spawn_preserving=False):
+    """Hash of canonical_board(board), shared by every equivalent board
+
+    Search caches, puzzle deduplication and analytics should all match
+    positions with this (or canonical_board itself), so that a hash taken
+    from a game agrees with one computed from a stored board.
+    """
+    return board_hash(canonical_board(board, spawn_preserving))
+
+# Board rules
+# Pure-function versions of the Game move, spawn and eviction rules, for
+# searches and simulations that run without a window
+DIRECTIONS = {"up": (-1, 0), "down": (1, 0), "left": (0, -1), "right": (0, 1)}
+SPAWN_VALUE_ODDS = ((2, 0.7), (4, 0.3))  # Same odds as add_random_tile
+
+def board_moves(board):
+    """Yield every legal (from_index, to_index) move of a single tile"""
+    for index, value in enumerate(board):
+        if not value:
+            continue
+        r, c = divmod(index, GRID_SIZE)
+        for dr, dc in DIRECTIONS.values():
+            nr, nc = r + dr, c + dc
+            if 0 <= nr < GRID_SIZE and 0 <= nc < GRID_SIZE:
+                dest = nr * GRID_SIZE + nc
+                if board[dest] == 0 or board[dest] == value:
+                    yield index, dest
+
+def apply_board_move(board, index, dest):
+    """Move the tile at index to dest, merging equal values
+
+    Returns the new board and the merged value (0 for a plain move).
+    """
+    cells = list(board)
+    merged = cells[index] * 2 if cells[dest] else 0
+    cells[dest] = merged or cells[index]
+    cells[index] = 0
+    return tuple(cells), merged
+
+def board_eviction_outcomes(board, protected=None):
+    """Return (probability, board) pairs after remove_low_value_tile makes room
+
+    protected is the index of the selected tile, which is never evicted.
+    """
+    if board.count(0) >= 3:
+        return [(1.0, board)]
+
+    # Lowest 25% of tiles and every tile tied with the last of them, chosen
+    # the same way as remove_low_value_tile
+    tiles = sorted((value, index) for index, value in enumerate(board) if value)
+    cutoff = tiles[max(1, len(tiles) // 4) - 1][0]
+    candidates = [index for value, index in tiles
+                  if value <= cutoff and index != protected]
+    if not candidates:
+        return [(1.0, board)]
+
+    outcomes = []
+    for index in candidates:
+        cells = list(board)
+        cells[index] = 0
+        for probability, result in board_eviction_outcomes(tuple(cells), protected):
+            outcomes.append((probability / len(candidates), result))
+    return outcomes
+
+def board_spawn_outcomes(board, protected=None):
+    """Return (probability, board) pairs for every result of add_random_tile"""
+    outcomes = []
+    for evict_probability, evicted in board_eviction_outcomes(board, protected):
+        # Top row first, any empty cell if the top row is full
+        cells = [c for c in range(GRID_SIZE) if evicted[c] == 0]
+        if not cells:
+            cells = [index for index, value in enumerate(evicted) if value == 0]
+        if not cells:
+            outcomes.append((evict_probability, evicted))
+            continue
+        for index in cells:
+            for value, value_probability in SPAWN_VALUE_ODDS:
+                spawned = list(evicted)
+                spawned[index] = value
+                outcomes.append((evict_probability / len(cells) * value_probability,
+                                 tuple(spawned)))
+    return outcomes
+
+def sample_board_spawn(board, rng, protected=None):
+    """Pick one add_random_tile outcome at random"""
+    roll = rng.random()
+    outcomes = board_spawn_outcomes(board, protected)
+    for probability, result in outcomes:
+        roll -= probability
+        if roll < 0:
+            return result
+    return outcomes[-1][1]
+
+# Playouts
+# Random games used to estimate how reachable a target is; run_playouts is a
+# process pool task, which is why it lives here rather than in the game
+PLAYOUT_MOVES = 80          # Moves per simulated playout
+PLAYOUT_MERGE_BIAS = 0.8    # Chance a playout takes a merge when one is available
+
+def simulate_playout(board, goal, moves, rng):
+    """Play random, merge-loving moves and return the highest tile reached"""
+    highest = max(board)
+    for _ in range(moves):
+        if highest >= goal:
+            break
+        legal = list(board_moves(board))
+        if not legal:
+            break
+        merges = [move for move in legal if board[move[1]]]
+        if merges and rng.random() < PLAYOUT_MERGE_BIAS:
+            index, dest = rng.choice(merges)
+        else:
+            index, dest = rng.choice(legal)
+        board, merged = apply_board_move(board, index, dest)
+        highest = max(highest, merged)
+        board = sample_board_spawn(board, rng, None if merged else dest)
+        highest = max(highest, max(board))
+    return highest
+
+def run_playouts(board, candidates, seconds, seed, moves=PLAYOUT_MOVES):
+    """Worker task: run playouts for a fixed time
+
+    Returns (playouts, successes) where successes[i] counts playouts that
+    reached candidates[i].
+    """
+    rng = random.Random(seed)
+    deadline = time.perf_counter() + seconds
+    playouts = 0
+    successes = [0] * len(candidates)
+    while time.perf_counter() < deadline:
+        highest = simulate_playout(board, candidates[-1], moves, rng)
+        playouts += 1
+        for i, candidate in enumerate(candidates):
+            if highest >= candidate:
+                successes[i] += 1
+    return playouts, successes
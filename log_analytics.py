@@ -0,0 +1,328 @@
+"""Streaming analytics over Tile Merger telemetry logs.
+
+Reads the JSON lines written by TelemetryLog (plain or .gz) in fixed-size
+chunks and folds every event into running aggregates, so memory depends on
+the number of levels and tile values seen, not on the size of the logs.
+Events the player undid are left out: each session's recent moves are held
+on an undo stack and only counted once they can no longer be undone.
+Files are sharded across a process pool and the partial results merged.
+Summaries are written as flat CSV tables, one row per key, ready to load
+into a dataframe or convert to a columnar format.
+
+Usage:
+    python log_analytics.py logs/*.jsonl --out summary/
+"""
+import argparse
+import csv
+import gzip
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+DEFAULT_CHUNK_LINES = 10000
+UNDO_LIMIT = 100000  # Moves the game keeps for undo (HISTORY_LIMIT in the game)
+
+# Events that start a new undoable step; the events after them (evictions,
+# completions, game over) belong to the same step
+STEP_EVENTS = ("move", "target")
+
+# Upper bounds (seconds) of the level time histogram buckets
+TIME_BUCKETS = (1, 2, 5, 10, 20, 30, 60, 120, 300, 600, float("inf"))
+
+def open_log(path):
+    """Open a log file for text reading, transparently handling gzip"""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+def read_chunks(path, chunk_lines=DEFAULT_CHUNK_LINES):
+    """Yield lists of at most chunk_lines raw lines from a log file"""
+    with open_log(path) as log_file:
+        while True:
+            chunk = list(islice(log_file, chunk_lines))
+            if not chunk:
+                return
+            yield chunk
+
+def read_events(path, chunk_lines=DEFAULT_CHUNK_LINES):
+    """Yield decoded events one at a time, skipping blank or corrupt lines"""
+    for chunk in read_chunks(path, chunk_lines):
+        for line in chunk:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+class LevelTimes:
+    """Running statistics of level completion times for one level"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.best_total = 0.0  # Sum of the best time known when each level finished
+        self.new_bests = 0     # Completions that set or matched the best time
+        self.buckets = [0] * len(TIME_BUCKETS)
+
+    def add(self, seconds, best_time):
+        self.count += 1
+        self.total += seconds
+        self.minimum = seconds if self.minimum is None else min(self.minimum, seconds)
+        self.maximum = seconds if self.maximum is None else max(self.maximum, seconds)
+        self.best_total += best_time
+        if seconds <= best_time:
+            self.new_bests += 1
+        for i, bound in enumerate(TIME_BUCKETS):
+            if seconds < bound:
+                self.buckets[i] += 1
+                break
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        if other.minimum is not None:
+            self.minimum = other.minimum if self.minimum is None else min(self.minimum, other.minimum)
+        if other.maximum is not None:
+            self.maximum = other.maximum if self.maximum is None else max(self.maximum, other.maximum)
+        self.best_total += other.best_total
+        self.new_bests += other.new_bests
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+
+    def median(self):
+        """Approximate median: the upper bound of the bucket holding the middle value"""
+        if not self.count:
+            return None
+        remaining = self.count / 2
+        for bound, count in zip(TIME_BUCKETS, self.buckets):
+            remaining -= count
+            if remaining <= 0:
+                return bound
+        return None
+
+class UndoStack:
+    """One session's events grouped into game steps, held while they can still be undone"""
+
+    def __init__(self, limit=UNDO_LIMIT):
+        self.limit = limit
+        self.done = deque()
+        self.undone = []
+
+    def record(self, event):
+        """Add an event; returns a step pushed past the undo limit, or None"""
+        if event.get("event") in STEP_EVENTS or not self.done:
+            self.done.append([event])
+            self.undone = []  # A new step discards whatever could be redone
+        else:
+            self.done[-1].append(event)
+        if len(self.done) > self.limit:
+            return self.done.popleft()
+        return None
+
+    def undo(self):
+        if self.done:
+            self.undone.append(self.done.pop())
+
+    def redo(self):
+        if self.undone:
+            self.done.append(self.undone.pop())
+
+def count_rows(counts):
+    """Turn a {key tuple: count} dict into rows sorted by key, missing keys last"""
+    return [key + (count,) for key, count in
+            sorted(counts.items(), key=lambda item: [(part is None, part or 0) for part in item[0]])]
+
+class LogStats:
+    """Aggregates that can be updated one event at a time and merged across shards
+
+    Gameplay events are only counted once they are final, so every table
+    shows net progression. Call finish() after the last event of a log.
+    """
+
+    def __init__(self):
+        self.events = 0
+        self.sessions = 0
+        self.level_times = {}   # level -> LevelTimes
+        self.moves = {}         # level -> moves played
+        self.evictions = {}     # (level, value) -> tiles evicted
+        self.targets = {}       # (level, target) -> times chosen
+        self.transitions = {}   # (previous_target, target) -> times chosen
+        self.game_overs = {}    # level -> games ended there
+        self.undos = {}         # level -> undos
+        self.redos = {}         # level -> redos
+        self.stacks = {}        # session -> UndoStack of events not yet counted
+
+    def update(self, event):
+        self.events += 1
+        kind = event.get("event")
+        level = event.get("level")
+        session = event.get("session")
+        if kind == "session_start":
+            self.sessions += 1
+            # A log is written by one session at a time, so earlier ones are over
+            self.finish()
+            self.stacks[session] = UndoStack()
+        elif kind == "undo":
+            self.undos[level] = self.undos.get(level, 0) + 1
+            if session in self.stacks:
+                self.stacks[session].undo()
+        elif kind == "redo":
+            self.redos[level] = self.redos.get(level, 0) + 1
+            if session in self.stacks:
+                self.stacks[session].redo()
+        elif kind in ("restart_level", "puzzle"):
+            # Restarting or loading a puzzle clears the game's undo history
+            self.finish(session)
+        else:
+            step = self.stacks.setdefault(session, UndoStack()).record(event)
+            for final in step or ():
+                self.count(final)
+
+    def finish(self, session=None):
+        """Count the remaining events of one session (or all), which are now final"""
+        sessions = list(self.stacks) if session is None else [session]
+        for name in sessions:
+            stack = self.stacks.pop(name, None)
+            if stack:
+                for step in stack.done:
+                    for event in step:
+                        self.count(event)
+
+    def count(self, event):
+        """Fold one final gameplay event into the aggregates"""
+        kind = event.get("event")
+        level = event.get("level")
+        if kind == "move":
+            self.moves[level] = self.moves.get(level, 0) + 1
+        elif kind == "evict":
+            key = (level, event.get("value"))
+            self.evictions[key] = self.evictions.get(key, 0) + 1
+        elif kind == "level_complete":
+            times = self.level_times.setdefault(level, LevelTimes())
+            times.add(event.get("time", 0), event.get("best_time", 0))
+        elif kind == "target":
+            key = (level, event.get("target"))
+            self.targets[key] = self.targets.get(key, 0) + 1
+            key = (event.get("previous_target"), event.get("target"))
+            self.transitions[key] = self.transitions.get(key, 0) + 1
+        elif kind == "game_over":
+            self.game_overs[level] = self.game_overs.get(level, 0) + 1
+
+    def merge(self, other):
+        """Fold another shard's aggregates into this one"""
+        self.events += other.events
+        self.sessions += other.sessions
+        other.finish()
+        for level, times in other.level_times.items():
+            self.level_times.setdefault(level, LevelTimes()).merge(times)
+        for mine, theirs in ((self.moves, other.moves),
+                             (self.evictions, other.evictions),
+                             (self.targets, other.targets),
+                             (self.transitions, other.transitions),
+                             (self.game_overs, other.game_overs),
+                             (self.undos, other.undos),
+                             (self.redos, other.redos)):
+            for key, count in theirs.items():
+                mine[key] = mine.get(key, 0) + count
+        return self
+
+    def tables(self):
+        """Return the summaries as {table name: (columns, rows)}"""
+        levels = sorted(set(self.level_times) | set(self.moves) | set(self.game_overs)
+                        | set(self.undos) | set(self.redos),
+                        key=lambda level: (level is None, level))
+        level_rows = []
+        for level in levels:
+            times = self.level_times.get(level, LevelTimes())
+            moves = self.moves.get(level, 0)
+            evictions = sum(count for (evict_level, _), count in self.evictions.items()
+                            if evict_level == level)
+            level_rows.append((
+                level,
+                times.count,
+                round(times.total / times.count, 3) if times.count else None,
+                times.median(),
+                times.minimum,
+                times.maximum,
+                round((times.total - times.best_total) / times.count, 3) if times.count else None,
+                times.new_bests,
+                moves,
+                evictions,
+                round(evictions / moves, 4) if moves else None,
+                self.game_overs.get(level, 0),
+                self.undos.get(level, 0),
+                self.redos.get(level, 0),
+            ))
+
+        return {
+            "levels": (("level", "completions", "mean_time", "median_time", "min_time",
+                        "max_time", "mean_time_over_best", "new_bests", "moves",
+                        "evictions", "evictions_per_move", "game_overs", "undos", "redos"),
+                       level_rows),
+            "evictions": (("level", "value", "count"),
+                          count_rows(self.evictions)),
+            "targets": (("level", "target", "count"),
+                        count_rows(self.targets)),
+            "target_transitions": (("previous_target", "target", "count"),
+                                   count_rows(self.transitions)),
+            "totals": (("events", "sessions", "undos", "redos"),
+                       [(self.events, self.sessions,
+                         sum(self.undos.values()), sum(self.redos.values()))]),
+        }
+
+def analyze_file(path, chunk_lines=DEFAULT_CHUNK_LINES):
+    """Worker task: aggregate a single log file"""
+    stats = LogStats()
+    for event in read_events(path, chunk_lines):
+        stats.update(event)
+    stats.finish()
+    return stats
+
+def analyze(paths, workers=None, chunk_lines=DEFAULT_CHUNK_LINES):
+    """Aggregate many log files, one file per worker task, and merge the results"""
+    total = LogStats()
+    if workers == 1 or len(paths) <= 1:
+        for path in paths:
+            total.merge(analyze_file(path, chunk_lines))
+        return total
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for stats in pool.map(analyze_file, paths, [chunk_lines] * len(paths)):
+            total.merge(stats)
+    return total
+
+def write_tables(stats, out_dir):
+    """Write every summary table as <out_dir>/<name>.csv"""
+    os.makedirs(out_dir, exist_ok=True)
+    written = []
+    for name, (columns, rows) in stats.tables().items():
+        path = os.path.join(out_dir, name + ".csv")
+        with open(path, "w", newline="", encoding="utf-8") as out_file:
+            writer = csv.writer(out_file)
+            writer.writerow(columns)
+            writer.writerows(rows)
+        written.append(path)
+    return written
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize Tile Merger telemetry logs")
+    parser.add_argument("logs", nargs="+", help="JSON lines logs (.jsonl or .jsonl.gz)")
+    parser.add_argument("--out", default="summary", help="directory for the CSV tables")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument("--chunk-lines", type=int, default=DEFAULT_CHUNK_LINES,
+                        help="lines read from a file at a time")
+    args = parser.parse_args(argv)
+
+    stats = analyze(args.logs, args.workers, args.chunk_lines)
+    for path in write_tables(stats, args.out):
+        print(path)
+    print(f"{stats.events} events from {stats.sessions} sessions")
+
+if __name__ == "__main__":
+    sys.exit(main())
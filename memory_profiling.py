@@ -0,0 +1,202 @@
+"""Memory profiling for long-running Tile Merger sessions.
+
+Tracks per-frame allocation churn with tracemalloc, the memory each call site
+retains over time, live pygame Surfaces and resident memory, and writes the
+results as a JSON report that can be compared between releases. The profiler
+lives in its own module so that its own allocations can be filtered out.
+"""
+import gc
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import pygame
+
+MEMORY_SAMPLE_FRAMES = 300     # Frames between tracemalloc snapshots
+MEMORY_TOP_SITES = 15          # Call sites reported per sample
+MEMORY_TREND_LEVELS = 5        # Level starts used to judge the resident memory trend
+MEMORY_TREND_WARNING = 1.0     # MiB of growth per level that triggers a warning
+
+logger = logging.getLogger("tile_merger")
+
+def resident_memory():
+    """Current resident set size of this process in bytes, or None if unavailable"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def peak_resident_memory():
+    """Highest resident set size this process has reached, or None if unavailable"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def count_surfaces():
+    """Count live pygame.Surface objects
+
+    Surfaces are not tracked by the garbage collector themselves, so they
+    are found through the containers (dicts, lists, frames, ...) that are.
+    """
+    seen = set()
+    for container in gc.get_objects():
+        for referent in gc.get_referents(container):
+            if isinstance(referent, pygame.Surface):
+                seen.add(id(referent))
+    return len(seen)
+
+class MemoryProfiler:
+    """Per-frame allocation and surface instrumentation for long sessions
+
+    Every frame it records how much Python memory was allocated and freed
+    again (the tracemalloc peak above the frame's starting level); this churn
+    is a total, tracemalloc cannot say which call sites it came from. Every
+    sample_frames frames it takes a snapshot and reports, per call site,
+    the memory retained per frame since the previous snapshot, together with
+    the live Surface count and resident memory. Current resident memory is
+    also recorded at each level start; a warning is logged when it keeps
+    growing. Where only the peak is available (no /proc) the trend is not
+    judged, since a peak can never go down.
+    """
+
+    def __init__(self, path, sample_frames=MEMORY_SAMPLE_FRAMES, top_sites=MEMORY_TOP_SITES):
+        self.path = path
+        self.sample_frames = sample_frames
+        self.top_sites = top_sites
+        self.frames = 0
+        self.samples = []
+        self.level_memory = []  # (level, resident bytes) at each level start
+        self.warnings = []
+        self.level = None
+        self.window_frames = 0
+        self.window_churn = 0
+        self.window_peak_churn = 0
+        self.started = time.time()
+        self.snapshot = None
+        self.frame_start = 0
+        # Skip allocations made by the profiler itself (its samples and
+        # snapshots) and by tracemalloc
+        self.filters = [tracemalloc.Filter(False, __file__),
+                        tracemalloc.Filter(False, tracemalloc.__file__),
+                        tracemalloc.Filter(False, "<frozen importlib._bootstrap>")]
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.snapshot = tracemalloc.take_snapshot().filter_traces(self.filters)
+        tracemalloc.reset_peak()
+        self.frame_start = tracemalloc.get_traced_memory()[0]
+
+    def on_frame(self, game):
+        """Call once per frame, after drawing"""
+        if self.snapshot is None:
+            self.start()
+        current, peak = tracemalloc.get_traced_memory()
+        churn = max(0, peak - self.frame_start)
+        self.window_churn += churn
+        self.window_peak_churn = max(self.window_peak_churn, churn)
+        self.frames += 1
+        self.window_frames += 1
+        
+        if game.level != self.level:
+            self.level = game.level
+            self.record_level(game.level)
+        if self.window_frames >= self.sample_frames:
+            self.take_sample(game)
+        
+        tracemalloc.reset_peak()
+        self.frame_start = tracemalloc.get_traced_memory()[0]
+
+    def take_sample(self, game):
+        """Snapshot allocations and group what was retained by call site"""
+        snapshot = tracemalloc.take_snapshot().filter_traces(self.filters)
+        differences = snapshot.compare_to(self.snapshot, "lineno")
+        frames = self.window_frames
+        sites = [{
+            "site": "%s:%d" % (stat.traceback[0].filename, stat.traceback[0].lineno),
+            "retained_bytes_per_frame": round(stat.size_diff / frames, 1),
+            "retained_blocks_per_frame": round(stat.count_diff / frames, 3),
+            "live_bytes": stat.size,
+        } for stat in differences[:self.top_sites] if stat.size_diff]
+        
+        traced, _ = tracemalloc.get_traced_memory()
+        self.samples.append({
+            "frame": self.frames,
+            "seconds": round(time.time() - self.started, 1),
+            "level": game.level,
+            "resident_bytes": resident_memory(),
+            "peak_resident_bytes": peak_resident_memory(),
+            "traced_bytes": traced,
+            "surfaces": count_surfaces(),
+            "churn_bytes_per_frame": round(self.window_churn / frames),
+            "max_churn_bytes": self.window_peak_churn,
+            "sites": sites,
+        })
+        self.snapshot = snapshot
+        self.window_frames = 0
+        self.window_churn = 0
+        self.window_peak_churn = 0
+
+    def record_level(self, level):
+        """Note resident memory at a level start and warn if it trends upward"""
+        resident = resident_memory()
+        if resident is None:
+            return  # Peak memory alone cannot show a trend
+        self.level_memory.append((level, resident))
+        recent = self.level_memory[-MEMORY_TREND_LEVELS:]
+        if len(recent) < MEMORY_TREND_LEVELS:
+            return
+        
+        # Least-squares slope of resident memory over the recent level starts
+        count = len(recent)
+        mean_x = sum(range(count)) / count
+        mean_y = sum(memory for _, memory in recent) / count
+        slope = (sum((i - mean_x) * (memory - mean_y) for i, (_, memory) in enumerate(recent)) /
+                 sum((i - mean_x) ** 2 for i in range(count)))
+        growth = slope / (1024 * 1024)
+        rising = all(b[1] >= a[1] for a, b in zip(recent, recent[1:]))
+        if rising and growth > MEMORY_TREND_WARNING:
+            message = ("Resident memory grew %.1f MiB per level over the last %d levels (now %.1f MiB)"
+                       % (growth, count, resident / (1024 * 1024)))
+            logger.warning(message)
+            self.warnings.append({"frame": self.frames, "level": level, "message": message})
+
+    def report(self):
+        """The full report as a JSON-ready dict"""
+        residents = [sample["resident_bytes"] or sample["peak_resident_bytes"]
+                     for sample in self.samples]
+        residents = [resident for resident in residents if resident]
+        return {
+            "environment": {
+                "python": platform.python_version(),
+                "pygame": pygame.version.ver,
+                "platform": platform.platform(),
+            },
+            "summary": {
+                "frames": self.frames,
+                "seconds": round(time.time() - self.started, 1),
+                "max_surfaces": max((sample["surfaces"] for sample in self.samples), default=None),
+                "max_resident_bytes": max(residents, default=None),
+                "mean_churn_bytes_per_frame": round(
+                    sum(sample["churn_bytes_per_frame"] for sample in self.samples) / len(self.samples))
+                    if self.samples else None,
+            },
+            "level_memory": [{"level": level, "resident_bytes": memory}
+                             for level, memory in self.level_memory],
+            "warnings": self.warnings,
+            "samples": self.samples,
+        }
+
+    def export(self):
+        """Write the report to the profiler's JSON file"""
+        with open(self.path, "w", encoding="utf-8") as report_file:
+            json.dump(self.report(), report_file, indent=2)
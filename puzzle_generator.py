@@ -0,0 +1,311 @@
+"""Offline generator for curated, provably solvable start positions.
+
+Boards are sampled, then verified with a bounded search over the game's
+selected-tile move rules and its spawn/eviction rules. A board is kept when
+the player has a strategy that reaches the target within K moves whatever
+tiles spawn or get evicted; K is the puzzle's difficulty. Verified boards are
+written to a compact on-disk index that the game memory-maps and reads one
+puzzle at a time.
+
+Usage:
+    python puzzle_generator.py puzzles.idx --targets 64 128 --samples 200000
+"""
+import argparse
+import heapq
+import mmap
+import os
+import random
+import shutil
+import struct
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from board_rules import (
+    GRID_SIZE,
+    apply_board_move,
+    board_moves,
+    board_spawn_outcomes,
+    canonical_board,
+)
+
+# Index file layout (all little-endian):
+#   header: magic, version, cells per board, number of groups
+#   group table: target, difficulty, reserved, data offset, puzzle count
+#   data: one record per puzzle, one byte per cell holding log2(value) (0 = empty)
+INDEX_MAGIC = b"TMPI"
+INDEX_VERSION = 2  # 2: eviction ties are all candidates, older puzzles may not verify
+HEADER_FORMAT = struct.Struct("<4sHHI")
+GROUP_FORMAT = struct.Struct("<IHHQQ")
+RECORD_SIZE = GRID_SIZE * GRID_SIZE
+
+DEFAULT_MAX_DEPTH = 4     # Longest solution (in moves) a puzzle may need
+DEFAULT_CHUNK_SIZE = 500  # Boards sampled per worker task
+SORT_RUN_RECORDS = 1 << 20  # Records sorted in memory at a time while deduplicating
+
+def encode_board(board):
+    """Pack a board into RECORD_SIZE bytes of log2 values"""
+    return bytes(value.bit_length() - 1 if value else 0 for value in board)
+
+def decode_board(record):
+    """Unpack a stored record back into a board tuple"""
+    return tuple(1 << exponent if exponent else 0 for exponent in record)
+
+def sample_board(target, rng):
+    """Sample a board whose tiles are all below the target, with room to spawn"""
+    target_exponent = target.bit_length() - 1
+    tile_count = rng.randint(3, GRID_SIZE * GRID_SIZE - 2)
+    lowest = max(1, target_exponent - 5)
+    # Favour values close to the target so short solutions are common
+    exponents = list(range(lowest, target_exponent))
+    weights = [exponent - lowest + 1 for exponent in exponents]
+    cells = [0] * (GRID_SIZE * GRID_SIZE)
+    for index in rng.sample(range(len(cells)), tile_count):
+        cells[index] = 1 << rng.choices(exponents, weights)[0]
+    return tuple(cells)
+
+def can_reach(board, target, depth, memo):
+    """True if the target can be forced within depth moves from this board"""
+    highest = max(board)
+    if highest >= target:
+        return True
+    if depth == 0:
+        return False
+    # A move can at most double the largest tile, and spawns add at most 4
+    if highest << depth < target or sum(board) + 4 * depth < target:
+        return False
+
+    key = (canonical_board(board, spawn_preserving=True), depth)
+    if key in memo:
+        return memo[key]
+
+    result = False
+    for index, dest in board_moves(board):
+        moved, merged = apply_board_move(board, index, dest)
+        if merged >= target:
+            result = True
+            break
+        # The moved tile stays selected (and safe from eviction) unless it merged
+        protected = None if merged else dest
+        if all(can_reach(spawned, target, depth - 1, memo)
+               for _, spawned in board_spawn_outcomes(moved, protected)):
+            result = True
+            break
+    memo[key] = result
+    return result
+
+def solution_depth(board, target, max_depth):
+    """Return the fewest moves that force the target, or None beyond max_depth"""
+    memo = {}
+    for depth in range(1, max_depth + 1):
+        if can_reach(board, target, depth, memo):
+            return depth
+    return None
+
+def generate_chunk(seed, target, samples, max_depth):
+    """Worker task: sample boards and return (difficulty, record) for the solvable ones"""
+    rng = random.Random(seed)
+    found = []
+    for _ in range(samples):
+        board = canonical_board(sample_board(target, rng), spawn_preserving=True)
+        depth = solution_depth(board, target, max_depth)
+        if depth is not None:
+            found.append((depth, encode_board(board)))
+    return found
+
+def build_index(path, targets, samples, max_depth=DEFAULT_MAX_DEPTH,
+                workers=None, seed=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Generate puzzles across a process pool and write them to an index file
+
+    Records are spooled to one temporary file per (target, difficulty) group
+    as they arrive and each spool is deduplicated by sorting it before the
+    index is written, so memory stays flat however many puzzles are found.
+    Returns a dict of (target, difficulty) -> puzzle count.
+    """
+    rng = random.Random(seed)
+    spool_dir = tempfile.mkdtemp(prefix="puzzles-")
+    spools = {}
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {}
+            for target in targets:
+                remaining = samples
+                while remaining > 0:
+                    size = min(chunk_size, remaining)
+                    future = pool.submit(generate_chunk, rng.getrandbits(64),
+                                         target, size, max_depth)
+                    futures[future] = target
+                    remaining -= size
+
+            for future in as_completed(futures):
+                target = futures[future]
+                for difficulty, record in future.result():
+                    group = (target, difficulty)
+                    if group not in spools:
+                        spools[group] = open(os.path.join(spool_dir, "%d-%d" % group), "wb")
+                    spools[group].write(record)
+
+        for spool in spools.values():
+            spool.close()
+        counts = {group: dedupe_spool(spool.name) for group, spool in spools.items()}
+        write_index(path, spool_dir, counts)
+    finally:
+        for spool in spools.values():
+            spool.close()
+        shutil.rmtree(spool_dir, ignore_errors=True)
+    return counts
+
+def read_records(record_file):
+    """Yield the fixed-size records of an open binary file in order"""
+    while True:
+        record = record_file.read(RECORD_SIZE)
+        if len(record) < RECORD_SIZE:
+            return
+        yield record
+
+def dedupe_spool(path):
+    """Sort a spool file in place, dropping duplicate records, and return its count
+
+    The spool is sorted in runs of SORT_RUN_RECORDS that are then merged, so
+    memory depends on the run size rather than on the size of the group.
+    """
+    runs = []
+    try:
+        with open(path, "rb") as spool:
+            while True:
+                data = spool.read(SORT_RUN_RECORDS * RECORD_SIZE)
+                if not data:
+                    break
+                records = sorted({data[i:i + RECORD_SIZE]
+                                  for i in range(0, len(data), RECORD_SIZE)})
+                run = tempfile.TemporaryFile(dir=os.path.dirname(path))
+                run.write(b"".join(records))
+                run.seek(0)
+                runs.append(run)
+
+        count = 0
+        previous = None
+        with open(path, "wb") as spool:
+            for record in heapq.merge(*(read_records(run) for run in runs)):
+                if record != previous:
+                    spool.write(record)
+                    count += 1
+                    previous = record
+        return count
+    finally:
+        for run in runs:
+            run.close()
+
+def write_index(path, spool_dir, counts):
+    """Assemble the header, group table and spooled records into one file"""
+    groups = sorted(counts)
+    offset = HEADER_FORMAT.size + GROUP_FORMAT.size * len(groups)
+    with open(path, "wb") as index_file:
+        index_file.write(HEADER_FORMAT.pack(INDEX_MAGIC, INDEX_VERSION, RECORD_SIZE, len(groups)))
+        for target, difficulty in groups:
+            count = counts[(target, difficulty)]
+            index_file.write(GROUP_FORMAT.pack(target, difficulty, 0, offset, count))
+            offset += count * RECORD_SIZE
+        for group in groups:
+            with open(os.path.join(spool_dir, "%d-%d" % group), "rb") as spool:
+                shutil.copyfileobj(spool, index_file)
+
+class PuzzleIndex:
+    """Read-only, memory-mapped view of a puzzle index file
+
+    Only the group table is parsed up front; boards are decoded on demand,
+    so opening an index of millions of puzzles is instant.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, record_size, group_count = HEADER_FORMAT.unpack_from(self.data, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError("Not a puzzle index: %s" % path)
+        if record_size != RECORD_SIZE:
+            raise ValueError("Index was built for a %d-cell board" % record_size)
+
+        self.groups = {}  # (target, difficulty) -> (offset, count)
+        for i in range(group_count):
+            target, difficulty, _, offset, count = GROUP_FORMAT.unpack_from(
+                self.data, HEADER_FORMAT.size + i * GROUP_FORMAT.size)
+            self.groups[(target, difficulty)] = (offset, count)
+
+    def __len__(self):
+        return sum(count for _, count in self.groups.values())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def count(self, target, difficulty):
+        """Number of puzzles stored for a target and difficulty"""
+        return self.groups.get((target, difficulty), (0, 0))[1]
+
+    def get(self, target, difficulty, position):
+        """Return one stored board by its position within its group"""
+        offset, count = self.groups[(target, difficulty)]
+        if not 0 <= position < count:
+            raise IndexError(position)
+        start = offset + position * RECORD_SIZE
+        return decode_board(self.data[start:start + RECORD_SIZE])
+
+    def random_puzzle(self, target, difficulty=None, rng=random):
+        """Pick a random board for the target, optionally at a fixed difficulty
+
+        Returns (board, difficulty), or None if nothing matches.
+        """
+        groups = [(group, count) for group, (_, count) in self.groups.items()
+                  if group[0] == target and count
+                  and (difficulty is None or group[1] == difficulty)]
+        if not groups:
+            return None
+        # Weight groups by size so every matching puzzle is equally likely
+        position = rng.randrange(sum(count for _, count in groups))
+        for (_, group_difficulty), count in groups:
+            if position < count:
+                return self.get(target, group_difficulty, position), group_difficulty
+            position -= count
+
+def load_random_puzzle(game, index, target, difficulty=None, rng=random):
+    """Start the game's level from a random indexed puzzle instead of initialize_grid"""
+    puzzle = index.random_puzzle(target, difficulty, rng)
+    if puzzle is None:
+        return False
+    board, _ = puzzle
+    game.load_puzzle(board, target)
+    return True
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate solvable Tile Merger puzzles")
+    parser.add_argument("output", help="index file to write")
+    parser.add_argument("--targets", type=int, nargs="+", default=[64],
+                        help="target tile values (powers of 2)")
+    parser.add_argument("--samples", type=int, default=10000,
+                        help="boards to sample per target")
+    parser.add_argument("--max-depth", type=int, default=DEFAULT_MAX_DEPTH,
+                        help="longest allowed solution in moves")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    for target in args.targets:
+        if target < 4 or target & (target - 1):
+            parser.error("targets must be powers of 2 of at least 4")
+
+    counts = build_index(args.output, args.targets, args.samples,
+                         args.max_depth, args.workers, args.seed)
+    for (target, difficulty), count in sorted(counts.items()):
+        print(f"target {target:>6}  {difficulty} moves: {count} puzzles")
+    print(f"{sum(counts.values())} puzzles written to {args.output}")
+
+if __name__ == "__main__":
+    sys.exit(main())
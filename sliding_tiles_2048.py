@@ -1,15 +1,36 @@
+import os
+# Playout pool workers re-import this module as __mp_main__; they only need
+# board_rules, so keep each of them from printing pygame's banner
+if __name__ == "__mp_main__":
+    os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
 import pygame
 import random
 import sys
 import time
 import math
+import json
+import argparse
+import queue
+import struct
+import threading
+import zlib
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from pygame.locals import *
 
-# Initialize pygame
-pygame.init()
+from board_rules import (
+    GRID_SIZE,
+    PositionHasher,
+    canonical_board,
+    run_playouts,
+)
+from memory_profiling import MemoryProfiler
+from puzzle_generator import PuzzleIndex, load_random_puzzle
+
+logger = logging.getLogger("tile_merger")
 
 # Constants
-GRID_SIZE = 4
 CELL_SIZE = 100
 MARGIN = 10
 WINDOW_WIDTH = GRID_SIZE * (CELL_SIZE + MARGIN) + MARGIN
@@ -24,6 +45,12 @@ SELECTED_TILE_COLOR = (255, 140, 0, 180)  # Bright orange selection
 SPECIAL_TILE_COLOR = (0, 191, 255)  # Deep sky blue for special tiles
 TARGET_TILE_COLOR = (255, 215, 0)  # Gold color for target tiles
 
+# CELL_SIZE, MARGIN, WINDOW_WIDTH and WINDOW_HEIGHT describe the base layout;
+# the resizable window scales it to fit (see Layout)
+BOARD_HEIGHT = GRID_SIZE * (CELL_SIZE + MARGIN) + MARGIN
+SPRITE_BUILD_BUDGET = 0.004  # Seconds per frame spent re-rasterizing after a resize
+SPRITE_TEXT_LIMIT = 24       # Text sprites kept per cache; the least recently used go first
+
 # Game states
 STATE_PLAYING = 0
 STATE_LEVEL_COMPLETE = 1
@@ -97,6 +124,618 @@ def get_tile_color(value):
     
     return (int(r * 255), int(g * 255), int(b * 255))
 
+class Theme:
+    """A named color palette with tile and contrast text colors worked out up front
+
+    colors maps the roles used by the renderer ("background", "grid",
+    "empty_cell", "text", "tile_text", "selected", "special", "target", "timer",
+    "best_time", "message", "hurray", "overlay", "overlay_text") to colors.
+    """
+
+    def __init__(self, name, colors, tile_colors=None):
+        self.name = name
+        self.colors = colors
+        self.tile_colors = dict(TILE_COLORS)
+        self.tile_colors.update(tile_colors or {})
+        
+        # Precompile (tile color, text color) for every known tile value
+        self.palette = {value: self.compile_tile(color) for value, color in self.tile_colors.items()}
+
+    def compile_tile(self, base_color):
+        """Pair a tile color with the text color that contrasts with it"""
+        r, g, b = base_color
+        brightness = (r * 299 + g * 587 + b * 114) / 1000
+        return base_color, WHITE if brightness < 180 else self.colors["tile_text"]
+
+    def tile_palette(self, value):
+        """Return (tile color, text color) for any tile value"""
+        entry = self.palette.get(value)
+        if entry is None:
+            entry = self.palette[value] = self.compile_tile(get_tile_color(value))
+        return entry
+
+THEMES = {
+    "light": Theme("light", {
+        "background": BACKGROUND_COLOR,
+        "grid": GRID_COLOR,
+        "empty_cell": EMPTY_CELL_COLOR,
+        "text": TEXT_COLOR,
+        "tile_text": TEXT_COLOR,        # Text on light tiles
+        "selected": SELECTED_TILE_COLOR,
+        "special": SPECIAL_TILE_COLOR,
+        "target": TARGET_TILE_COLOR,
+        "timer": (0, 100, 200),
+        "best_time": (0, 150, 0),
+        "message": (255, 100, 100),
+        "hurray": (255, 215, 0),
+        "overlay": (0, 0, 0, 180),
+        "overlay_text": WHITE,
+    }),
+    "dark": Theme("dark", {
+        "background": (28, 24, 38),     # Near-black violet
+        "grid": (58, 48, 78),           # Dark purple grid
+        "empty_cell": (82, 70, 104),    # Muted purple cells
+        "text": (236, 226, 255),        # Pale lavender text
+        "tile_text": (48, 16, 80),      # Text on light tiles
+        "selected": (255, 140, 0, 180),
+        "special": (0, 191, 255),
+        "target": (255, 215, 0),
+        "timer": (110, 170, 255),
+        "best_time": (90, 210, 120),
+        "message": (255, 120, 120),
+        "hurray": (255, 215, 0),
+        "overlay": (0, 0, 0, 200),
+        "overlay_text": WHITE,
+    }),
+}
+DEFAULT_THEME = "light"
+THEME_WARMUP_BUDGET = 0.002  # Seconds per frame spent pre-rendering inactive themes
+
+# Difficulty-driven target selection
+# (level, chance a playout should reach the target) points; levels in between
+# are interpolated and levels past the last point use its chance
+DIFFICULTY_CURVE = ((1, 0.9), (5, 0.6), (10, 0.4), (20, 0.25))
+TARGET_CANDIDATE_STEPS = 3   # Candidates: next power of 2 above the max tile, x2, x4
+TARGET_POLICY_BUDGET = 0.6   # Seconds of playouts, well within the level-complete overlay
+TARGET_POLICY_TASK = 0.1     # Seconds per worker task, so partial results are usable early
+
+def desired_success(level, curve=DIFFICULTY_CURVE):
+    """Chance of reaching the target that the curve asks for at a level"""
+    if level <= curve[0][0]:
+        return curve[0][1]
+    for (level_a, chance_a), (level_b, chance_b) in zip(curve, curve[1:]):
+        if level <= level_b:
+            return chance_a + (chance_b - chance_a) * (level - level_a) / (level_b - level_a)
+    return curve[-1][1]
+
+class TargetEstimator:
+    """Optional target policy: estimates how reachable candidate targets are
+
+    start() launches a batch of short, time-boxed playout tasks on a process
+    pool as soon as a level is complete. choose() is called when the player
+    continues; it never blocks, using whichever tasks have finished and
+    cancelling the rest, and returns None if there is nothing to go on.
+
+    The workers are started up front, before the game opens its window or
+    any recorder threads, so the first level's estimate does not pay for
+    process startup. They come from a fresh forkserver (or spawn) process
+    rather than a fork of the running game.
+    """
+
+    def __init__(self, workers=None, budget=TARGET_POLICY_BUDGET, curve=DIFFICULTY_CURVE):
+        # Leave a core for the render loop and the recorder's encoder threads
+        self.workers = workers or max(1, (os.cpu_count() or 1) - 1)
+        self.budget = budget
+        self.curve = curve
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        # An empty task per worker makes the pool start all of its processes now
+        empty = (0,) * (GRID_SIZE * GRID_SIZE)
+        for _ in range(self.workers):
+            self.pool.submit(run_playouts, empty, (2,), 0, 0)
+        self.futures = []
+        self.board = None
+        self.level = None
+        self.candidates = []
+
+    def start(self, board, level, seed):
+        """Begin estimating targets for the given level from this board"""
+        self.cancel()
+
+        # Next power of 2 above the largest tile, then harder options
+        next_power = 2
+        while next_power <= max(board):
+            next_power *= 2
+        self.candidates = [next_power << step for step in range(TARGET_CANDIDATE_STEPS)]
+        self.board = board
+        self.level = level
+
+        rounds = max(1, int(self.budget / TARGET_POLICY_TASK))
+        self.futures = [self.pool.submit(run_playouts, board, self.candidates,
+                                         TARGET_POLICY_TASK, seed + task)
+                        for task in range(rounds * self.workers)]
+
+    def cancel(self):
+        """Drop any outstanding playout tasks"""
+        for future in self.futures:
+            future.cancel()
+        self.futures = []
+
+    def estimates(self):
+        """Return {candidate: estimated chance} from finished tasks"""
+        playouts = 0
+        successes = [0] * len(self.candidates)
+        for future in self.futures:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                count, hits = future.result()
+                playouts += count
+                successes = [a + b for a, b in zip(successes, hits)]
+        if not playouts:
+            return {}
+        return {candidate: hits / playouts for candidate, hits in zip(self.candidates, successes)}
+
+    def choose(self, board, level):
+        """Pick the candidate whose chance best matches the curve, without waiting"""
+        if board != self.board or level != self.level:
+            return None  # The estimate was made for a different position
+        estimates = self.estimates()
+        self.cancel()
+        if not estimates:
+            return None
+        wanted = desired_success(level, self.curve)
+        return min(estimates, key=lambda candidate: (abs(estimates[candidate] - wanted), candidate))
+
+    def shutdown(self):
+        self.cancel()
+        if self.pool:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+# Undo history settings
+HISTORY_CHECKPOINT_INTERVAL = 1000  # Moves between full board checkpoints
+HISTORY_LIMIT = 100000              # Moves kept for undo before the oldest are dropped
+
+class MoveRecord:
+    """Everything one move changed: touched cells plus game counters before and after"""
+    __slots__ = ("cells", "before", "after")
+
+    def __init__(self, before):
+        self.cells = {}       # (row, col) -> tile snapshot before the move
+        self.before = before  # Counters before the move
+        self.after = None     # Counters after the move, set on commit
+
+class GameHistory:
+    """Persistent undo/redo history that stores only the cells each move touched
+
+    Tiles are snapshotted as (value, is_special) tuples and counters as
+    (total_score, level, current_target, state, rng_step, target_count), so
+    undo and redo only rewrite the handful of cells a move changed. Every
+    checkpoint_interval moves a full snapshot is kept; once more than limit
+    moves are stored, the oldest block up to the next checkpoint is dropped.
+    """
+
+    def __init__(self, checkpoint_interval=HISTORY_CHECKPOINT_INTERVAL, limit=HISTORY_LIMIT):
+        self.checkpoint_interval = checkpoint_interval
+        self.limit = limit
+        self.clear()
+
+    def clear(self):
+        """Forget all recorded moves"""
+        self.records = []      # Applied records followed by undone ones
+        self.cursor = 0        # records[:cursor] are applied
+        self.offset = 0        # Number of moves dropped from the front
+        self.checkpoints = {}  # Move number -> full game snapshot
+        self.current = None    # Record being built for the move in progress
+
+    @property
+    def position(self):
+        """Number of moves applied since the history was cleared"""
+        return self.offset + self.cursor
+
+    def can_undo(self):
+        return self.current is None and self.cursor > 0
+
+    def can_redo(self):
+        return self.current is None and self.cursor < len(self.records)
+
+    def begin(self, game):
+        """Start recording a move"""
+        if not self.checkpoints:
+            self.checkpoints[self.position] = game.snapshot()
+        self.current = MoveRecord(game.counters())
+
+    def touch(self, game, row, col):
+        """Remember a cell's contents before the current move changes it"""
+        if self.current is not None and (row, col) not in self.current.cells:
+            self.current.cells[(row, col)] = tile_snapshot(game.grid[row][col])
+
+    def commit(self, game):
+        """Finish the current move and store only what it changed"""
+        record = self.current
+        if record is None:
+            return
+        self.current = None
+        record.after = game.counters()
+        # Freeze the changes as (row, col, before, after) tuples
+        record.cells = tuple((r, c, before, tile_snapshot(game.grid[r][c]))
+                             for (r, c), before in record.cells.items())
+
+        # A new move discards anything that could have been redone
+        if self.cursor < len(self.records):
+            del self.records[self.cursor:]
+            for position in [p for p in self.checkpoints if p > self.position]:
+                del self.checkpoints[position]
+
+        self.records.append(record)
+        self.cursor += 1
+        if self.position % self.checkpoint_interval == 0:
+            self.checkpoints[self.position] = game.snapshot()
+
+        # Keep memory bounded by dropping the oldest block of moves
+        if len(self.records) > self.limit:
+            later_checkpoints = [p for p in self.checkpoints if p > self.offset]
+            oldest = min(later_checkpoints) if later_checkpoints else None
+            if oldest is not None and oldest - self.offset <= self.cursor:
+                del self.records[:oldest - self.offset]
+                self.cursor -= oldest - self.offset
+                self.offset = oldest
+                for position in [p for p in self.checkpoints if p < oldest]:
+                    del self.checkpoints[position]
+
+    def undo(self, game):
+        """Revert the last applied move"""
+        if not self.can_undo():
+            return False
+        self.cursor -= 1
+        record = self.records[self.cursor]
+        game.restore_cells((r, c, before) for r, c, before, _ in record.cells)
+        game.restore_counters(record.before)
+        return True
+
+    def redo(self, game):
+        """Re-apply the last undone move"""
+        if not self.can_redo():
+            return False
+        record = self.records[self.cursor]
+        self.cursor += 1
+        game.restore_cells((r, c, after) for r, c, _, after in record.cells)
+        game.restore_counters(record.after)
+        return True
+
+    def seek(self, game, position):
+        """Jump to any stored move number via the nearest earlier checkpoint"""
+        if not self.offset <= position <= self.offset + len(self.records) or self.current is not None:
+            return False
+        checkpoint = max(p for p in self.checkpoints if p <= position)
+        game.restore_snapshot(self.checkpoints[checkpoint])
+        self.cursor = checkpoint - self.offset
+        while self.position < position:
+            self.redo(game)
+        return True
+
+def tile_snapshot(tile):
+    """Immutable snapshot of a grid cell: (value, is_special) or None when empty"""
+    if tile is None:
+        return None
+    return (tile.value, tile.is_special)
+
+class TelemetryLog:
+    """Append-only JSON lines log of game events for replays and analytics
+
+    Every line is one event: {"event": name, "session": id, "t": seconds
+    since the session started, ...event fields}.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "a", encoding="utf-8")
+        self.session = None
+        self.session_start = time.time()
+
+    def start_session(self, seed):
+        """Begin a new game session in the log"""
+        self.session = "%x-%x" % (int(time.time() * 1000), seed & 0xFFFFFFFF)
+        self.session_start = time.time()
+        self.emit("session_start", seed=seed)
+
+    def emit(self, event, **fields):
+        """Write one event line"""
+        record = {"event": event, "session": self.session,
+                  "t": round(time.time() - self.session_start, 3)}
+        record.update(fields)
+        self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def close(self):
+        self.file.close()
+
+# Frame capture settings
+CAPTURE_QUEUE_SIZE = 8     # Frames waiting for the encoder before new ones are dropped
+CAPTURE_WORKERS = 2        # Encoder threads for PNG sequences
+CAPTURE_PNG_LEVEL = 3      # zlib level: fast, still much smaller than raw
+REPLAY_FRAME_TIME = 1 / 60 # Simulated seconds per frame in headless replays
+
+def write_png(path, width, height, rgb):
+    """Write packed 8-bit RGB pixels as a PNG file"""
+    row_size = width * 3
+    # Every PNG scanline starts with a filter type byte (0 = none)
+    raw = b"".join(b"\x00" + rgb[y * row_size:(y + 1) * row_size] for y in range(height))
+    
+    def chunk(kind, data):
+        return (struct.pack(">I", len(data)) + kind + data +
+                struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF))
+    
+    with open(path, "wb") as png_file:
+        png_file.write(b"\x89PNG\r\n\x1a\n")
+        png_file.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        png_file.write(chunk(b"IDAT", zlib.compress(raw, CAPTURE_PNG_LEVEL)))
+        png_file.write(chunk(b"IEND", b""))
+
+class FrameRecorder:
+    """Records rendered frames to a PNG sequence or a raw RGB24 video stream
+
+    capture() reads the surface's pixel buffer directly and copies it into a
+    recycled buffer (one memcpy, no per-frame allocation), then queues it.
+    Encoder threads convert and compress off the game loop; zlib and file
+    writes release the GIL. When the queue is full a realtime recorder drops
+    the frame rather than stall the game; a blocking recorder (headless
+    replays) waits instead so no frame is lost.
+
+    PNG frames are written at whatever size the window has. A raw stream has
+    one frame size, so a resize closes it and continues in a new segment
+    (frames.1.rgb, frames.2.rgb, ...); segments lists (path, size) of each.
+    Raw streams can be encoded with e.g.
+    ffmpeg -f rawvideo -pix_fmt rgb24 -s WxH -r 60 -i frames.rgb out.mp4
+    """
+
+    def __init__(self, path, fmt="png", block=False,
+                 queue_size=CAPTURE_QUEUE_SIZE, workers=CAPTURE_WORKERS):
+        if fmt not in ("png", "raw"):
+            raise ValueError("Unknown capture format: %s" % fmt)
+        self.path = path
+        self.fmt = fmt
+        self.block = block
+        self.frames = 0
+        self.dropped = 0
+        self.segments = []
+        self.queue = queue.Queue(queue_size)
+        # Buffers are recycled between frames, one per queue slot and worker
+        self.free_buffers = queue.Queue()
+        
+        if fmt == "png":
+            os.makedirs(path, exist_ok=True)
+            self.stream = None
+        else:
+            # A raw stream must be written in order, so it gets one writer
+            self.stream = open(path, "wb")
+            self.stream_size = None
+            workers = 1
+        self.workers = [threading.Thread(target=self.encode_frames, daemon=True)
+                        for _ in range(workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def capture(self, surface):
+        """Queue a copy of the surface's current pixels"""
+        width, height = surface.get_size()
+        if self.queue.full() and not self.block:
+            self.dropped += 1
+            return False
+        
+        # The common 24 and 32 bit layouts are read straight from the surface's
+        # memory; anything else has to be converted by pygame first
+        bytes_per_pixel = surface.get_bytesize()
+        if bytes_per_pixel in (3, 4):
+            pixels = surface.get_buffer()
+            pitch = surface.get_pitch()
+            offsets = tuple(shift // 8 for shift in surface.get_shifts()[:3])
+        else:
+            pixels = pygame.image.tobytes(surface, "RGB")
+            bytes_per_pixel, pitch, offsets = 3, width * 3, (0, 1, 2)
+        
+        try:
+            buffer = self.free_buffers.get_nowait()
+        except queue.Empty:
+            buffer = None
+        if buffer is None or len(buffer) < pitch * height:
+            buffer = bytearray(pitch * height)  # First frames, or the window grew
+        memoryview(buffer)[:pitch * height] = memoryview(pixels)
+        del pixels  # Unlocks the surface
+        
+        self.queue.put((self.frames, buffer, width, height, pitch, bytes_per_pixel, offsets))
+        self.frames += 1
+        return True
+
+    def encode_frames(self):
+        """Encoder thread: turn queued buffers into files until told to stop"""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            index, buffer, width, height, pitch, bytes_per_pixel, offsets = item
+            try:
+                rgb = self.to_rgb(buffer, width, height, pitch, bytes_per_pixel, offsets)
+                if self.stream:
+                    if (width, height) != self.stream_size:
+                        self.next_segment(width, height)
+                    self.stream.write(rgb)
+                else:
+                    write_png(os.path.join(self.path, "frame_%06d.png" % index), width, height, rgb)
+            finally:
+                self.free_buffers.put(buffer)
+                self.queue.task_done()
+
+    def next_segment(self, width, height):
+        """Continue a raw stream at a new frame size (encoder thread only)"""
+        if self.stream_size is not None:
+            self.stream.close()
+            root, ext = os.path.splitext(self.path)
+            path = "%s.%d%s" % (root, len(self.segments), ext)
+            logger.warning("Frame size changed to %dx%d, raw capture continues in %s",
+                           width, height, path)
+            self.stream = open(path, "wb")
+        else:
+            path = self.path
+        self.stream_size = (width, height)
+        self.segments.append((path, self.stream_size))
+
+    def to_rgb(self, buffer, width, height, pitch, bytes_per_pixel, offsets):
+        """Repack surface pixels into tightly packed RGB24"""
+        rgb = bytearray(width * height * 3)
+        row_bytes = width * bytes_per_pixel
+        for y in range(height):
+            row = buffer[y * pitch:y * pitch + row_bytes]
+            start = y * width * 3
+            for channel, offset in enumerate(offsets):
+                rgb[start + channel:start + width * 3:3] = row[offset::bytes_per_pixel]
+        return bytes(rgb)
+
+    def close(self):
+        """Wait for queued frames to be written and stop the encoder threads"""
+        self.queue.join()
+        for _ in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join()
+        if self.stream:
+            self.stream.close()
+
+class Layout:
+    """Maps base layout coordinates onto the current window size
+
+    Everything is positioned in base coordinates (a WINDOW_WIDTH x
+    WINDOW_HEIGHT design) and scaled uniformly to fit, centered in the window.
+    The scale is rounded down to 1/100 so small drags reuse the same sprites.
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.scale = max(0.1, math.floor(min(width / WINDOW_WIDTH, height / WINDOW_HEIGHT) * 100) / 100)
+        self.offset_x = (width - WINDOW_WIDTH * self.scale) / 2
+        self.offset_y = (height - WINDOW_HEIGHT * self.scale) / 2
+
+    def point(self, x, y):
+        """Window pixel position of a base coordinate"""
+        return (int(round(self.offset_x + x * self.scale)),
+                int(round(self.offset_y + y * self.scale)))
+
+    def size(self, length):
+        """Window pixel length of a base length"""
+        return max(1, int(round(length * self.scale)))
+
+    def to_base(self, pos):
+        """Base coordinate of a window pixel position"""
+        return ((pos[0] - self.offset_x) / self.scale,
+                (pos[1] - self.offset_y) / self.scale)
+
+    def cell_at(self, pos):
+        """Grid (row, col) under a window pixel position, or None outside the grid"""
+        x, y = self.to_base(pos)
+        col = int((x - MARGIN) // (CELL_SIZE + MARGIN))
+        row = int((y - MARGIN) // (CELL_SIZE + MARGIN))
+        if 0 <= row < GRID_SIZE and 0 <= col < GRID_SIZE:
+            return row, col
+        return None
+
+# SysFont lookups are slow, so each (pixel size, bold) font is created once
+_font_cache = {}
+
+def get_font(size, bold=False):
+    """Return the game font at a pixel size"""
+    font = _font_cache.get((size, bold))
+    if font is None:
+        font = pygame.font.SysFont("Clear Sans", size, bold=bold)
+        _font_cache[(size, bold)] = font
+    return font
+
+class SpriteCache:
+    """Pre-rendered surfaces for one scale, rebuilt a few at a time when it changes
+
+    builder(key, scale) rasterizes the sprite for a key. After set_scale the
+    old sprites stay in use, stretched to the new size, while step() rebuilds
+    them within a per-frame time budget; the new set replaces the old one
+    only once every sprite is ready. Text changes with the level and timer,
+    so only the text_limit most recently used text sprites are kept.
+    """
+
+    def __init__(self, builder, scale, text_limit=SPRITE_TEXT_LIMIT):
+        self.builder = builder
+        self.scale = scale
+        self.text_limit = text_limit
+        self.sprites = {}
+        self.pending_scale = None
+        self.pending = {}
+        self.queue = {}  # Keys waiting to be built, in insertion order
+
+    def set_scale(self, scale):
+        """Start rebuilding every known sprite at a new scale"""
+        if scale == self.scale:
+            self.pending_scale, self.pending = None, {}
+            self.queue = {}
+        elif scale != self.pending_scale:
+            self.pending_scale = scale
+            self.pending = {}
+            self.queue = dict.fromkeys(self.sprites)
+
+    def request(self, keys):
+        """Queue sprites to be built by step() before they are first needed"""
+        built = self.pending if self.pending_scale is not None else self.sprites
+        for key in keys:
+            if key not in built:
+                self.queue[key] = None
+
+    def ready(self):
+        """True when nothing is waiting to be built"""
+        return not self.queue and self.pending_scale is None
+
+    def get(self, key):
+        """Return the sprite for key at the newest scale"""
+        if self.pending_scale is None:
+            sprite = self.sprites.get(key)
+            if sprite is None:
+                sprite = self.store(self.sprites, key, self.builder(key, self.scale))
+            elif key[0] == "text":
+                self.sprites[key] = self.sprites.pop(key)  # Most recently used last
+            return sprite
+
+        sprite = self.pending.get(key)
+        if sprite is not None:
+            return sprite
+        old = self.sprites.get(key)
+        if old is None:
+            # Not drawn before the resize, so there is nothing to stretch
+            return self.store(self.pending, key, self.builder(key, self.pending_scale))
+        ratio = self.pending_scale / self.scale
+        return pygame.transform.scale(old, (max(1, round(old.get_width() * ratio)),
+                                            max(1, round(old.get_height() * ratio))))
+
+    def store(self, built, key, sprite):
+        """Add a sprite, dropping the least recently used text over the limit"""
+        built[key] = sprite
+        if key[0] == "text":
+            texts = [old for old in built if old[0] == "text"]
+            for old in texts[:max(0, len(texts) - self.text_limit)]:
+                del built[old]
+        return sprite
+
+    def step(self, budget=SPRITE_BUILD_BUDGET):
+        """Build queued sprites until the time budget (seconds) is used up"""
+        if self.ready():
+            return
+        if self.pending_scale is not None:
+            built, scale = self.pending, self.pending_scale
+        else:
+            built, scale = self.sprites, self.scale
+        deadline = time.perf_counter() + budget
+        while self.queue and time.perf_counter() < deadline:
+            key, _ = self.queue.popitem()
+            if key not in built:
+                self.store(built, key, self.builder(key, scale))
+        if self.pending_scale is not None and not self.queue:
+            self.sprites, self.scale = self.pending, self.pending_scale
+            self.pending, self.pending_scale = {}, None
+
 class Tile:
     def __init__(self, value, row, col, is_special=False):
         self.value = value
@@ -142,92 +781,64 @@ class Tile:
                 self.x += dx * dt * 15
                 self.y += dy * dt * 15
 
-    def draw(self, screen, font):
-        # Determine tile color
+    def sprite_kind(self):
+        """Which tile sprite to draw: target, special or plain"""
         if self.is_target_tile:
-            # Gold color for target value tiles
-            base_color = TARGET_TILE_COLOR
-            # Add pulsing glow effect for target tiles
-            glow_size = int(5 + 3 * math.sin(self.glow_effect))
-            glow_surf = pygame.Surface((CELL_SIZE+glow_size*2, CELL_SIZE+glow_size*2), pygame.SRCALPHA)
-            glow_color = (*TARGET_TILE_COLOR, 150)  # Gold with alpha
-            pygame.draw.rect(glow_surf, glow_color,
-                           (0, 0, CELL_SIZE+glow_size*2, CELL_SIZE+glow_size*2), 0, 10)
-            screen.blit(glow_surf, (self.x-glow_size, self.y-glow_size))
-        elif self.is_special:
-            base_color = get_tile_color(self.value)  # Use the value's color for special tiles
-            # Add pulsing glow effect for special tiles
+            return "target"
+        if self.is_special:
+            return "special"
+        return "plain"
+
+    def draw(self, screen, layout, sprites):
+        kind = self.sprite_kind()
+        
+        # Add pulsing glow effect for target and special tiles
+        if kind != "plain":
             glow_size = int(5 + 3 * math.sin(self.glow_effect))
-            glow_surf = pygame.Surface((CELL_SIZE+glow_size*2, CELL_SIZE+glow_size*2), pygame.SRCALPHA)
-            glow_color = (*SPECIAL_TILE_COLOR, 150)  # Add alpha for transparency
-            pygame.draw.rect(glow_surf, glow_color,
-                           (0, 0, CELL_SIZE+glow_size*2, CELL_SIZE+glow_size*2), 0, 10)
-            screen.blit(glow_surf, (self.x-glow_size, self.y-glow_size))
-        else:
-            base_color = get_tile_color(self.value)  # Use our function to get color for any value
+            screen.blit(sprites.get(("glow", kind, glow_size)),
+                        layout.point(self.x - glow_size, self.y - glow_size))
         
         # Draw selection highlight
         if self.selected:
-            select_surf = pygame.Surface((CELL_SIZE+10, CELL_SIZE+10), pygame.SRCALPHA)
-            pygame.draw.rect(select_surf, SELECTED_TILE_COLOR,
-                           (0, 0, CELL_SIZE+10, CELL_SIZE+10), 0, 8)
-            screen.blit(select_surf, (self.x-5, self.y-5))
+            screen.blit(sprites.get(("select",)), layout.point(self.x - 5, self.y - 5))
         
         # Draw main tile with merge animation
-        anim_scale = 1 + 0.1 * self.merge_animation
-        anim_offset = (CELL_SIZE * (anim_scale - 1)) / 2
-        pygame.draw.rect(screen, base_color,
-                       (self.x - anim_offset, self.y - anim_offset,
-                        CELL_SIZE * anim_scale, CELL_SIZE * anim_scale), 0, 5)
-
-        # Draw value text
-        # Determine text color based on background brightness for better contrast
-        r, g, b = base_color
-        brightness = (r * 299 + g * 587 + b * 114) / 1000
-        text_color = WHITE if brightness < 180 else TEXT_COLOR  # Use white text on dark backgrounds
-        
-        # Adjust font size based on the number of digits
-        value_str = str(self.value)
-        if len(value_str) <= 2:
-            font_size = 36
-        elif len(value_str) <= 3:
-            font_size = 32
-        elif len(value_str) <= 4:
-            font_size = 28
-        elif len(value_str) <= 5:
-            font_size = 24
-        elif len(value_str) <= 6:
-            font_size = 20
+        sprite = sprites.get(("tile", self.value, kind))
+        if self.merge_animation > 0:
+            anim_scale = 1 + 0.1 * self.merge_animation
+            anim_offset = (CELL_SIZE * (anim_scale - 1)) / 2
+            size = layout.size(CELL_SIZE * anim_scale)
+            sprite = pygame.transform.scale(sprite, (size, size))
+            screen.blit(sprite, layout.point(self.x - anim_offset, self.y - anim_offset))
         else:
-            font_size = 16
-            
-        value_font = pygame.font.SysFont("Clear Sans", font_size, bold=True)
-        text = value_font.render(value_str, True, text_color)
-        text_rect = text.get_rect(center=(self.x + CELL_SIZE//2, self.y + CELL_SIZE//2))
-        screen.blit(text, text_rect)
-        
-        # Add a star icon for target tiles
-        if self.is_target_tile:
-            # Draw a small star
-            crown_text = value_font.render("★", True, (255, 255, 255))
-            crown_rect = crown_text.get_rect(center=(self.x + CELL_SIZE//2, self.y + CELL_SIZE//4 - 10))
-            screen.blit(crown_text, crown_rect)
-            
-        # Add a special indicator for special tiles (previous level targets)
-        elif self.is_special:
-            # Draw a small crown or other symbol
-            special_text = value_font.render("♦", True, (255, 255, 255))
-            special_rect = special_text.get_rect(center=(self.x + CELL_SIZE//2, self.y + CELL_SIZE//4 - 10))
-            screen.blit(special_text, special_rect)
+            screen.blit(sprite, layout.point(self.x, self.y))
 
 class Game:
-    def __init__(self):
-        self.screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
+    def __init__(self, seed=None, telemetry=None, theme=DEFAULT_THEME, recorder=None,
+                 target_policy=None, profiler=None, puzzles=None):
+        # Initialize pygame (a no-op on restart); it is not done at import so
+        # that pool workers importing this module do not start SDL
+        pygame.init()
+        
+        # Reuse the window on restart so a resized window keeps its size
+        self.screen = pygame.display.get_surface()
+        if self.screen is None:
+            self.screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT), pygame.RESIZABLE)
         pygame.display.set_caption("Tile Merger Puzzle")
         self.clock = pygame.time.Clock()
-        self.font = pygame.font.SysFont("Clear Sans", 36, bold=True)
-        self.ui_font = pygame.font.SysFont("Clear Sans", 24)
-        self.title_font = pygame.font.SysFont("Clear Sans", 48, bold=True)
+        
+        # Layout and cached sprites for the current window size, one sprite
+        # cache per theme so switching themes is a swap rather than a redraw
+        self.layout = Layout(*self.screen.get_size())
+        self.theme_caches = {
+            name: SpriteCache(lambda key, scale, theme=theme: self.build_sprite(key, scale, theme),
+                              self.layout.scale)
+            for name, theme in THEMES.items()
+        }
+        self.theme = THEMES[theme if theme in THEMES else DEFAULT_THEME]
+        self.sprites = self.theme_caches[self.theme.name]
+        self.next_theme = None
+        self.overlay = None
         
         self.state = STATE_PLAYING
         self.level = 1
@@ -251,6 +862,35 @@ class Game:
         self.level_completion_time = 0       # How long it took to complete the level
         self.best_times = {}                 # Store best times for each level
         
+        # Zobrist hashes of the board, kept up to date on every cell change
+        self.hasher = PositionHasher()
+        
+        # Game randomness is reseeded from (seed, step) before every move so
+        # that undo only has to remember the step number to restore it
+        self.rng = random.Random()
+        self.rng_seed = seed if seed is not None else random.getrandbits(64)
+        self.rng_step = 0
+        
+        # Undo/redo history of every move
+        self.history = GameHistory()
+        
+        # Optional frame capture (FrameRecorder), fed from draw()
+        self.recorder = recorder
+        
+        # Optional TargetEstimator used to pick each new level's target
+        self.target_policy = target_policy
+        
+        # Optional MemoryProfiler, sampled once per frame
+        self.profiler = profiler
+        
+        # Optional PuzzleIndex that new and restarted levels start from
+        self.puzzles = puzzles
+        
+        # Optional event log (TelemetryLog) for replays and analytics
+        self.telemetry = telemetry
+        if self.telemetry:
+            self.telemetry.start_session(self.rng_seed)
+        
         self.initialize_grid()
 
     def initialize_grid(self):
@@ -259,15 +899,46 @@ class Game:
         self.tiles = []
         self.selected_tile = None
         self.add_new_tile_after_move = False
+        self.hasher.reset()
+        self.history.clear()
+        self.reseed_rng()
         
         # Reset the level timer
         self.level_start_time = time.time()
         self.level_completion_time = 0
         
+        # Start from a curated puzzle for the target when an index is attached
+        if self.puzzles and load_random_puzzle(self, self.puzzles, self.current_target,
+                                               rng=self.rng):
+            return
+        
         # Add 2 random tiles to start
         self.add_random_tile()
         self.add_random_tile()
 
+    def load_puzzle(self, board, target):
+        """Start the level from a stored puzzle board instead of random tiles"""
+        self.log_event("puzzle", level=self.level, target=target, board=list(board))
+        self.grid = [[None for _ in range(GRID_SIZE)] for _ in range(GRID_SIZE)]
+        self.tiles = []
+        self.selected_tile = None
+        self.move_in_progress = False
+        self.add_new_tile_after_move = False
+        self.hasher.reset()
+        self.history.clear()
+        self.reseed_rng()
+
+        # Reset the level timer
+        self.level_start_time = time.time()
+        self.level_completion_time = 0
+
+        # Place the puzzle tiles and set its target
+        self.restore_cells((index // GRID_SIZE, index % GRID_SIZE, (value, False))
+                           for index, value in enumerate(board) if value)
+        self.current_target = target
+        self.targets[-1] = target
+        self.state = STATE_PLAYING
+
     def add_random_tile(self):
         """Add a new tile to a random empty cell in the top row"""
         # Check if we need to ensure minimum empty spaces (at least 3)
@@ -290,19 +961,21 @@ class Game:
                           if self.grid[r][c] is None]
             if not empty_cells:
                 return False  # No empty cells
-            r, c = random.choice(empty_cells)
+            r, c = self.rng.choice(empty_cells)
         else:
-            r, c = random.choice(empty_top_cells)
+            r, c = self.rng.choice(empty_top_cells)
         
         # Determine tile value - only basic values: 2 (70%), 4 (30%)
         # No special tiles in random generation
         value_options = [2, 2, 2, 2, 2, 2, 2, 4, 4, 4]
-        value = random.choice(value_options)
+        value = self.rng.choice(value_options)
         
         # Create the tile (never special from random generation)
+        self.history.touch(self, r, c)
         self.grid[r][c] = Tile(value, r, c, is_special=False)
         new_tile = self.grid[r][c]
         self.tiles.append(new_tile)
+        self.hasher.toggle(r, c, value)
         
         # Check if this tile matches or exceeds the target value
         if value >= self.current_target:
@@ -320,21 +993,28 @@ class Game:
         if not self.tiles:
             return False
             
-        # Sort tiles by value (lowest first)
-        low_value_tiles = sorted(self.tiles, key=lambda t: t.value)
+        # Sort tiles by value (lowest first), then by position so the order
+        # does not depend on the order tiles were added (e.g. after an undo)
+        low_value_tiles = sorted(self.tiles, key=lambda t: (t.value, t.row, t.col))
         
-        # Take the lowest 25% of tiles
+        # Take the lowest 25% of tiles, plus every tile tied with the last of
+        # them, so which tiles qualify never depends on where they sit (a
+        # mirrored board has mirrored candidates)
         num_candidates = max(1, len(low_value_tiles) // 4)
-        candidates = low_value_tiles[:num_candidates]
+        cutoff = low_value_tiles[num_candidates - 1].value
+        candidates = [t for t in low_value_tiles if t.value <= cutoff]
         
         # Don't remove selected tiles or special/target tiles
         valid_candidates = [t for t in candidates if not (t.selected or t.is_special or t.is_target_tile)]
         
         if valid_candidates:
             # Remove a random low-value tile
-            tile_to_remove = random.choice(valid_candidates)
+            tile_to_remove = self.rng.choice(valid_candidates)
+            self.history.touch(self, tile_to_remove.row, tile_to_remove.col)
+            self.log_event("evict", level=self.level, value=tile_to_remove.value)
             self.grid[tile_to_remove.row][tile_to_remove.col] = None
             self.tiles.remove(tile_to_remove)
+            self.hasher.toggle(tile_to_remove.row, tile_to_remove.col, tile_to_remove.value)
             
             # If we removed the selected tile, clear the selection
             if tile_to_remove == self.selected_tile:
@@ -432,8 +1112,14 @@ class Game:
             
         if self.grid[target_row][target_col] is None:
             # Move to empty space
+            self.log_event("move", level=self.level, row=row, col=col, direction=direction)
+            self.begin_step()
+            self.history.touch(self, row, col)
+            self.history.touch(self, target_row, target_col)
             self.grid[target_row][target_col] = self.selected_tile
             self.grid[row][col] = None
+            self.hasher.toggle(row, col, self.selected_tile.value)
+            self.hasher.toggle(target_row, target_col, self.selected_tile.value)
             
             # Set movement animation
             self.selected_tile.target_row = target_row
@@ -454,10 +1140,16 @@ class Game:
             
         elif self.grid[target_row][target_col].value == self.selected_tile.value:
             # Merge with same value
+            self.log_event("move", level=self.level, row=row, col=col, direction=direction,
+                           merged=self.selected_tile.value * 2)
+            self.begin_step()
+            self.history.touch(self, row, col)
+            self.history.touch(self, target_row, target_col)
             target_tile = self.grid[target_row][target_col]
             new_value = self.selected_tile.value * 2
             
             # Update the target tile
+            self.hasher.update(target_row, target_col, target_tile.value, new_value)
             target_tile.value = new_value
             target_tile.merge_animation = 1
             
@@ -474,6 +1166,7 @@ class Game:
             # Remove the selected tile
             self.grid[row][col] = None
             self.tiles.remove(self.selected_tile)
+            self.hasher.toggle(row, col, self.selected_tile.value)
             self.selected_tile = None
             
             self.move_in_progress = True
@@ -487,6 +1180,40 @@ class Game:
             
         return False  # Invalid move
 
+    def complete_move(self):
+        """Finish a move once its animation is done: spawn, level and game over checks"""
+        self.move_in_progress = False
+        
+        # No automatic chain merges - only user-initiated moves
+        
+        # Check if any tile has reached or exceeded the target value
+        self.check_level_completion()
+        
+        # Check if there are only two different tiles left
+        if self.check_low_tile_count():
+            # Tiles were added, no need to add more
+            pass
+        # Add exactly one new tile after every move
+        elif self.add_new_tile_after_move:
+            # Always add exactly 1 tile
+            self.add_random_tile()
+            self.add_new_tile_after_move = False
+            
+            # Check again for level completion after adding a new tile
+            self.check_level_completion()
+        
+        # Check for game over
+        if self.state == STATE_PLAYING and self.check_game_over():
+            self.state = STATE_GAME_OVER
+            self.log_event("game_over", level=self.level, score=self.total_score)
+        elif self.state == STATE_LEVEL_COMPLETE:
+            self.log_event("level_complete", level=self.level, target=self.current_target,
+                           time=round(self.level_completion_time, 3),
+                           best_time=round(self.best_times.get(self.level, 0), 3))
+            self.estimate_next_target()
+        
+        self.history.commit(self)
+
     def check_level_completion(self):
         """Check if any tile has reached or exceeded the target value"""
         for tile in self.tiles:
@@ -553,14 +1280,37 @@ class Game:
             
         return target
 
-    def advance_level(self):
-        """Progress to next level while keeping ALL existing tiles"""
+    def estimate_next_target(self):
+        """Start the target policy's playouts while the level-complete overlay shows"""
+        if self.target_policy:
+            self.target_policy.start(self.board_values(), self.level + 1,
+                                     self.rng_seed + self.rng_step)
+
+    def choose_next_target(self):
+        """Target for the next level: the policy's pick if it has one ready"""
+        if self.target_policy:
+            target = self.target_policy.choose(self.board_values(), self.level)
+            if target:
+                return target
+        return self.generate_achievable_target()
+
+    def advance_level(self, target=None):
+        """Progress to next level while keeping ALL existing tiles
+        
+        target overrides the chosen target (used by replays).
+        """
+        self.begin_step()
+        
         # Increment level
         self.level += 1
         
         # Generate a new target that's a power of 2
-        self.current_target = self.generate_achievable_target()
+        previous_target = self.current_target
+        self.current_target = target or self.choose_next_target()
         self.targets.append(self.current_target)
+        self.log_event("target", level=self.level, target=self.current_target,
+                       previous_target=previous_target,
+                       max_tile=max((tile.value for tile in self.tiles), default=0))
         
         # Reset the level timer
         self.level_start_time = time.time()
@@ -583,6 +1333,10 @@ class Game:
                 if self.level not in self.best_times or 0 < self.best_times[self.level]:
                     self.best_times[self.level] = 0
                 self.total_score += tile.value
+                self.log_event("level_complete", level=self.level, target=self.current_target,
+                               time=0, best_time=0)
+                self.history.commit(self)
+                self.estimate_next_target()
                 return
         
         # If we have fewer than 2 tiles, add some new ones
@@ -595,17 +1349,20 @@ class Game:
             # Add up to 2 new tiles if there's space
             for _ in range(min(2, len(empty_cells))):
                 if empty_cells:
-                    r, c = random.choice(empty_cells)
+                    r, c = self.rng.choice(empty_cells)
                     empty_cells.remove((r, c))
                     
                     # Create a new basic tile (2 or 4)
-                    value = random.choice([2, 2, 2, 4])
+                    value = self.rng.choice([2, 2, 2, 4])
+                    self.history.touch(self, r, c)
                     self.grid[r][c] = Tile(value, r, c, is_special=False)
                     self.tiles.append(self.grid[r][c])
+                    self.hasher.toggle(r, c, value)
         
         # Important: Do NOT check for chain merges here - let the user initiate merges
         
         self.state = STATE_PLAYING
+        self.history.commit(self)
         
     def add_special_tile(self, value):
         """Add a special tile with the given value to the grid"""
@@ -614,44 +1371,269 @@ class Game:
                        if self.grid[r][c] is None]
         
         if center_cells:
-            r, c = random.choice(center_cells)
+            r, c = self.rng.choice(center_cells)
         else:
             # If center is full, find any empty cell
             empty_cells = [(r, c) for r in range(GRID_SIZE) for c in range(GRID_SIZE) 
                           if self.grid[r][c] is None]
             if not empty_cells:
                 return False  # No empty cells
-            r, c = random.choice(empty_cells)
+            r, c = self.rng.choice(empty_cells)
         
         # Create the special tile
+        self.history.touch(self, r, c)
         self.grid[r][c] = Tile(value, r, c, is_special=True)
         new_tile = self.grid[r][c]
         self.tiles.append(new_tile)
+        self.hasher.toggle(r, c, value)
         
         return True
 
+    def reseed_rng(self):
+        """Reseed the game's random generator for the next step"""
+        self.rng.seed(self.rng_seed + self.rng_step * 0x9E3779B97F4A7C15)
+        self.rng_step += 1
+
+    def begin_step(self):
+        """Start recording a move or level change for undo"""
+        self.history.begin(self)
+        self.reseed_rng()
+
+    def counters(self):
+        """Snapshot of the non-grid state that a move can change"""
+        return (self.total_score, self.level, self.current_target, self.state,
+                self.rng_step, len(self.targets))
+
+    def snapshot(self):
+        """Full snapshot of the game, used for history checkpoints"""
+        cells = tuple(tile_snapshot(self.grid[r][c])
+                      for r in range(GRID_SIZE) for c in range(GRID_SIZE))
+        return (cells, self.counters(), tuple(self.targets))
+
+    def restore_cells(self, cells):
+        """Put (row, col, tile snapshot) entries back on the grid"""
+        for r, c, snapshot in cells:
+            old_tile = self.grid[r][c]
+            if old_tile:
+                self.tiles.remove(old_tile)
+                self.hasher.toggle(r, c, old_tile.value)
+                self.grid[r][c] = None
+            if snapshot:
+                value, is_special = snapshot
+                self.grid[r][c] = Tile(value, r, c, is_special=is_special)
+                self.tiles.append(self.grid[r][c])
+                self.hasher.toggle(r, c, value)
+
+    def restore_counters(self, counters):
+        """Restore a counters() snapshot and tidy up per-move state"""
+        (self.total_score, self.level, self.current_target, self.state,
+         self.rng_step, target_count) = counters
+        if target_count < len(self.targets):
+            del self.targets[target_count:]
+        elif target_count > len(self.targets):
+            self.targets.append(self.current_target)
+        
+        for tile in self.tiles:
+            tile.selected = False
+            tile.is_target_tile = (tile.value >= self.current_target)
+        self.selected_tile = None
+        self.move_in_progress = False
+        self.add_new_tile_after_move = False
+
+    def restore_snapshot(self, snapshot):
+        """Restore a full snapshot() of the game"""
+        cells, counters, targets = snapshot
+        self.restore_cells((index // GRID_SIZE, index % GRID_SIZE, cell)
+                           for index, cell in enumerate(cells))
+        self.targets = list(targets)
+        self.restore_counters(counters)
+
+    def undo(self):
+        """Undo the last move or level change"""
+        if self.move_in_progress or not self.history.undo(self):
+            return False
+        self.log_event("undo", level=self.level)
+        return True
+
+    def redo(self):
+        """Redo the last undone move or level change"""
+        if self.move_in_progress or not self.history.redo(self):
+            return False
+        self.log_event("redo", level=self.level)
+        return True
+
+    def log_event(self, event, **fields):
+        """Record an event in the telemetry log, if one is attached"""
+        if self.telemetry:
+            self.telemetry.emit(event, **fields)
+
+    def board_values(self):
+        """Return the board as a flat row-major tuple of values (0 = empty)"""
+        return tuple(self.grid[r][c].value if self.grid[r][c] else 0
+                     for r in range(GRID_SIZE) for c in range(GRID_SIZE))
+
+    def position_hash(self):
+        """Zobrist hash of the current board"""
+        return self.hasher.hash
+
+    def canonical_position_hash(self, spawn_preserving=False):
+        """Hash shared by all symmetric variants of the current board
+        
+        Equal to canonical_hash(board) and to board_hash of canonical_board(),
+        so it can be matched against stored canonical boards. With
+        spawn_preserving=True only symmetries that keep the top spawn row in
+        place are considered, so equal hashes play out identically.
+        """
+        return self.hasher.canonical_hash(self.board_values(), spawn_preserving)
+
+    def canonical_board(self, spawn_preserving=False):
+        """Return the canonical form of the current board"""
+        return canonical_board(self.board_values(), spawn_preserving)
+
+    def resize(self, width, height):
+        """Recompute the layout for a new window size"""
+        self.screen = pygame.display.get_surface()
+        self.layout = Layout(width, height)
+        for cache in self.theme_caches.values():
+            cache.set_scale(self.layout.scale)
+        self.overlay = None
+
+    def set_theme(self, name):
+        """Switch themes as soon as the theme's sprites are ready"""
+        if name in THEMES and name != self.theme.name:
+            self.next_theme = name
+            self.theme_caches[name].request(self.sprites.sprites)
+
+    def cycle_theme(self):
+        """Switch to the next theme in THEMES"""
+        names = list(THEMES)
+        current = self.next_theme or self.theme.name
+        self.set_theme(names[(names.index(current) + 1) % len(names)])
+
+    def update_theme_caches(self):
+        """Keep every theme's sprites ready in the background and swap themes"""
+        if self.next_theme:
+            cache = self.theme_caches[self.next_theme]
+            cache.step()
+            if cache.ready():
+                self.theme = THEMES[self.next_theme]
+                self.sprites = cache
+                self.next_theme = None
+                self.overlay = None
+        
+        # Pre-render inactive themes a little at a time, so a later switch is instant
+        for cache in self.theme_caches.values():
+            if cache is not self.sprites:
+                cache.request(self.sprites.sprites)
+                cache.step(THEME_WARMUP_BUDGET)
+
+    def build_sprite(self, key, scale, theme):
+        """Rasterize one cached sprite at a scale for a theme (see SpriteCache)"""
+        kind = key[0]
+        if kind == "board":
+            # Grid background with the empty cells drawn in
+            surface = pygame.Surface((round(WINDOW_WIDTH * scale), round(BOARD_HEIGHT * scale)))
+            surface.fill(theme.colors["grid"])
+            cell = round(CELL_SIZE * scale)
+            for r in range(GRID_SIZE):
+                for c in range(GRID_SIZE):
+                    pygame.draw.rect(surface, theme.colors["empty_cell"],
+                                   (round((MARGIN + c*(CELL_SIZE+MARGIN)) * scale),
+                                    round((MARGIN + r*(CELL_SIZE+MARGIN)) * scale),
+                                    cell, cell), 0, max(1, round(5 * scale)))
+            return surface
+        
+        if kind == "glow":
+            _, tile_kind, glow_size = key
+            size = round((CELL_SIZE + glow_size*2) * scale)
+            color = theme.colors["target" if tile_kind == "target" else "special"][:3]
+            surface = pygame.Surface((size, size), pygame.SRCALPHA)
+            pygame.draw.rect(surface, (*color, 150), (0, 0, size, size), 0, max(1, round(10 * scale)))
+            return surface
+        
+        if kind == "select":
+            size = round((CELL_SIZE + 10) * scale)
+            surface = pygame.Surface((size, size), pygame.SRCALPHA)
+            pygame.draw.rect(surface, theme.colors["selected"], (0, 0, size, size), 0, max(1, round(8 * scale)))
+            return surface
+        
+        if kind == "tile":
+            return self.build_tile_sprite(key[1], key[2], scale, theme)
+        
+        if kind == "text":
+            _, text, font_size, bold, role = key
+            return get_font(max(1, round(font_size * scale)), bold).render(text, True, theme.colors[role])
+        
+        raise KeyError(key)
+
+    def build_tile_sprite(self, value, tile_kind, scale, theme):
+        """Rasterize a tile body with its value text and marker"""
+        # Gold color for target value tiles, the value's color otherwise,
+        # each with its precompiled contrasting text color
+        if tile_kind == "target":
+            base_color, text_color = theme.compile_tile(theme.colors["target"])
+        else:
+            base_color, text_color = theme.tile_palette(value)
+        size = round(CELL_SIZE * scale)
+        surface = pygame.Surface((size, size), pygame.SRCALPHA)
+        pygame.draw.rect(surface, base_color, (0, 0, size, size), 0, max(1, round(5 * scale)))
+        
+        # Adjust font size based on the number of digits
+        value_str = str(value)
+        if len(value_str) <= 2:
+            font_size = 36
+        elif len(value_str) <= 3:
+            font_size = 32
+        elif len(value_str) <= 4:
+            font_size = 28
+        elif len(value_str) <= 5:
+            font_size = 24
+        elif len(value_str) <= 6:
+            font_size = 20
+        else:
+            font_size = 16
+        
+        value_font = get_font(max(1, round(font_size * scale)), bold=True)
+        text = value_font.render(value_str, True, text_color)
+        surface.blit(text, text.get_rect(center=(size // 2, size // 2)))
+        
+        # Add a star icon for target tiles, a diamond for special tiles
+        marker = {"target": "★", "special": "♦"}.get(tile_kind)
+        if marker:
+            marker_text = value_font.render(marker, True, (255, 255, 255))
+            surface.blit(marker_text, marker_text.get_rect(
+                center=(size // 2, round((CELL_SIZE//4 - 10) * scale))))
+        return surface
+
+    def text_sprite(self, text, font_size, role, bold=False):
+        """Cached rendering of UI text in a theme color role (font_size in base pixels)"""
+        return self.sprites.get(("text", text, font_size, bold, role))
+
+    def blit_centered(self, surface, y):
+        """Blit a surface horizontally centered on the board at base height y"""
+        x, y = self.layout.point(WINDOW_WIDTH / 2, y)
+        self.screen.blit(surface, (x - surface.get_width() // 2, y))
+
     def draw(self):
         """Draw the game state"""
-        self.screen.fill(BACKGROUND_COLOR)
+        # Spend a little of each frame rebuilding sprites after a resize
+        # or theme change
+        self.sprites.step()
+        self.update_theme_caches()
         
-        # Draw grid background
-        pygame.draw.rect(self.screen, GRID_COLOR,
-                        (0, 0, WINDOW_WIDTH, GRID_SIZE*(CELL_SIZE+MARGIN)+MARGIN))
+        self.screen.fill(self.theme.colors["background"])
         
-        # Draw empty cells
-        for r in range(GRID_SIZE):
-            for c in range(GRID_SIZE):
-                pygame.draw.rect(self.screen, EMPTY_CELL_COLOR,
-                               (MARGIN + c*(CELL_SIZE+MARGIN),
-                                MARGIN + r*(CELL_SIZE+MARGIN),
-                                CELL_SIZE, CELL_SIZE), 0, 5)
+        # Draw grid background and empty cells
+        self.screen.blit(self.sprites.get(("board",)), self.layout.point(0, 0))
         
         # Draw tiles
         for tile in self.tiles:
-            tile.draw(self.screen, self.font)
+            tile.draw(self.screen, self.layout, self.sprites)
         
         # Draw UI
         self.draw_ui()
+        if self.recorder:
+            self.recorder.capture(self.screen)
         pygame.display.flip()
 
     def format_time(self, seconds):
@@ -666,27 +1648,26 @@ class Game:
 
     def draw_ui(self):
         """Draw user interface elements"""
-        y_offset = GRID_SIZE*(CELL_SIZE+MARGIN) + 20
-        
-        # Use consistent font for all main UI elements
-        ui_title_font = pygame.font.SysFont("Clear Sans", 36, bold=True)
+        y_offset = BOARD_HEIGHT + 10
         
         # Increase spacing between elements
         spacing = 60  # Increased from 40 to 60 for more separation
         
         # Put LEVEL and TARGET on the same line
         # For unlimited levels, ensure the level number is displayed properly
-        level_text = ui_title_font.render(f"LEVEL {self.level}", True, TEXT_COLOR)
-        target_text = ui_title_font.render(f"TARGET {self.current_target}", True, TARGET_TILE_COLOR)
+        level_text = self.text_sprite(f"LEVEL {self.level}", 36, "text", bold=True)
+        target_text = self.text_sprite(f"TARGET {self.current_target}", 36, "target", bold=True)
         
         # Calculate positions to place them on the same line with space between
-        total_width = level_text.get_width() + target_text.get_width() + 80  # 80px space between
-        level_x = (WINDOW_WIDTH - total_width) // 2
-        target_x = level_x + level_text.get_width() + 80
+        gap = self.layout.size(80)  # 80px space between
+        total_width = level_text.get_width() + target_text.get_width() + gap
+        center_x, line_y = self.layout.point(WINDOW_WIDTH / 2, y_offset)
+        level_x = center_x - total_width // 2
+        target_x = level_x + level_text.get_width() + gap
         
         # Draw LEVEL and TARGET on the same line
-        self.screen.blit(level_text, (level_x, y_offset))
-        self.screen.blit(target_text, (target_x, y_offset))
+        self.screen.blit(level_text, (level_x, line_y))
+        self.screen.blit(target_text, (target_x, line_y))
         
         # Display timer with clock icon below with increased spacing
         if self.state == STATE_PLAYING:
@@ -696,30 +1677,32 @@ class Game:
             time_str = self.format_time(self.level_completion_time)
         
         # Create a small clock icon using text (Unicode clock symbol)
-        clock_icon = ui_title_font.render("🕒", True, (0, 100, 200))
-        time_text = ui_title_font.render(f" {time_str}", True, (0, 100, 200))
+        # The time changes every second, so it is rendered each frame
+        clock_icon = self.text_sprite("🕒", 36, "timer", bold=True)
+        time_text = get_font(self.layout.size(36), bold=True).render(f" {time_str}", True, self.theme.colors["timer"])
         
         # Calculate positions to center the clock icon and time text together
         icon_and_time_width = clock_icon.get_width() + time_text.get_width()
-        clock_x = (WINDOW_WIDTH - icon_and_time_width) // 2
+        center_x, clock_y = self.layout.point(WINDOW_WIDTH / 2, y_offset + spacing)
+        clock_x = center_x - icon_and_time_width // 2
         time_x = clock_x + clock_icon.get_width()
         
         # Draw clock icon and time text centered below LEVEL and TARGET with more space
-        self.screen.blit(clock_icon, (clock_x, y_offset + spacing))
-        self.screen.blit(time_text, (time_x, y_offset + spacing))
+        self.screen.blit(clock_icon, (clock_x, clock_y))
+        self.screen.blit(time_text, (time_x, clock_y))
         
         # Display best time if available
         if self.level in self.best_times:
             best_time = self.best_times[self.level]
-            best_time_text = self.ui_font.render(f"BEST TIME: {self.format_time(best_time)}", True, (0, 150, 0))
-            self.screen.blit(best_time_text, (WINDOW_WIDTH//2 - best_time_text.get_width()//2, y_offset + spacing * 2))
+            best_time_text = self.text_sprite(f"BEST TIME: {self.format_time(best_time)}", 24, "best_time")
+            self.blit_centered(best_time_text, y_offset + spacing * 2)
         
         # Display chain merge message if active
         if self.chain_merge_timer > 0:
-            message_text = self.ui_font.render(self.chain_merge_message, True, (255, 100, 100))
+            message_text = self.text_sprite(self.chain_merge_message, 24, "message")
             # Position below other UI elements
             message_y = y_offset + spacing * (3 if self.level in self.best_times else 2)
-            self.screen.blit(message_text, (WINDOW_WIDTH//2 - message_text.get_width()//2, message_y))
+            self.blit_centered(message_text, message_y)
         
         # Game state messages
         if self.state == STATE_LEVEL_COMPLETE:
@@ -729,47 +1712,59 @@ class Game:
 
     def draw_message(self, title, subtitle):
         """Draw a centered message box"""
-        overlay = pygame.Surface((WINDOW_WIDTH, WINDOW_HEIGHT), pygame.SRCALPHA)
-        overlay.fill((0,0,0,180))
-        self.screen.blit(overlay, (0,0))
+        # The overlay covers the whole window and is rebuilt only on resize
+        if self.overlay is None:
+            self.overlay = pygame.Surface(self.screen.get_size(), pygame.SRCALPHA)
+            self.overlay.fill(self.theme.colors["overlay"])
+        self.screen.blit(self.overlay, (0,0))
         
         # For level completion, show only "HURRAY!" and best time
         if title == "Level Complete!":
             # Use a larger, more celebratory font for HURRAY!
-            hurray_font = pygame.font.SysFont("Clear Sans", 64, bold=True)
-            hurray_text = hurray_font.render("HURRAY!", True, (255, 215, 0))  # Gold color
+            hurray_text = self.text_sprite("HURRAY!", 64, "hurray", bold=True)  # Gold color
             
             # Show best time if available
             if self.level in self.best_times:
                 best_time = self.best_times[self.level]
-                best_time_text = self.font.render(f"BEST TIME: {self.format_time(best_time)}", True, WHITE)
+                best_time_text = self.text_sprite(f"BEST TIME: {self.format_time(best_time)}", 36, "overlay_text", bold=True)
             else:
-                best_time_text = self.font.render(f"TIME: {self.format_time(self.level_completion_time)}", True, WHITE)
+                best_time_text = self.text_sprite(f"TIME: {self.format_time(self.level_completion_time)}", 36, "overlay_text", bold=True)
                 
             # Add instruction to continue
-            continue_text = self.ui_font.render("Press SPACE BAR to continue", True, WHITE)
+            continue_text = self.text_sprite("Press SPACE BAR to continue", 24, "overlay_text")
             
             # Position all elements with proper spacing
-            self.screen.blit(hurray_text, 
-                           (WINDOW_WIDTH//2 - hurray_text.get_width()//2, 
-                            WINDOW_HEIGHT//2 - 80))
-            self.screen.blit(best_time_text,
-                           (WINDOW_WIDTH//2 - best_time_text.get_width()//2,
-                            WINDOW_HEIGHT//2))
-            self.screen.blit(continue_text,
-                           (WINDOW_WIDTH//2 - continue_text.get_width()//2,
-                            WINDOW_HEIGHT//2 + 60))
+            self.blit_centered(hurray_text, WINDOW_HEIGHT//2 - 80)
+            self.blit_centered(best_time_text, WINDOW_HEIGHT//2)
+            self.blit_centered(continue_text, WINDOW_HEIGHT//2 + 60)
         else:
             # For other messages (like game over), use the original format
-            title_text = self.title_font.render(title, True, WHITE)
-            sub_text = self.font.render(subtitle, True, WHITE)
+            title_text = self.text_sprite(title, 48, "overlay_text", bold=True)
+            sub_text = self.text_sprite(subtitle, 36, "overlay_text", bold=True)
             
-            self.screen.blit(title_text, 
-                           (WINDOW_WIDTH//2 - title_text.get_width()//2, 
-                            WINDOW_HEIGHT//2 - 50))
-            self.screen.blit(sub_text,
-                           (WINDOW_WIDTH//2 - sub_text.get_width()//2,
-                            WINDOW_HEIGHT//2 + 20))
+            self.blit_centered(title_text, WINDOW_HEIGHT//2 - 50)
+            self.blit_centered(sub_text, WINDOW_HEIGHT//2 + 20)
+
+    def update(self, dt):
+        """Advance animations and timers by dt seconds"""
+        # Update all tiles
+        all_stopped = True
+        for tile in self.tiles:
+            tile.update(dt)
+            if tile.moving:
+                all_stopped = False
+        
+        # Update chain merge message timer
+        if self.chain_merge_timer > 0:
+            self.chain_merge_timer -= dt
+        
+        # If a move was in progress and all tiles have stopped moving
+        if self.move_in_progress and all_stopped:
+            self.complete_move()
+
+    def animating(self):
+        """True while a move or merge animation is still playing"""
+        return self.move_in_progress or any(tile.merge_animation > 0 for tile in self.tiles)
 
     def run(self):
         """Main game loop"""
@@ -780,66 +1775,37 @@ class Game:
             
             dt = time.time() - self.last_time
             self.last_time = time.time()
-            
-            # Update all tiles
-            all_stopped = True
-            for tile in self.tiles:
-                tile.update(dt)
-                if tile.moving:
-                    all_stopped = False
-            
-            # Update chain merge message timer
-            if self.chain_merge_timer > 0:
-                self.chain_merge_timer -= dt
-            
-            # If a move was in progress and all tiles have stopped moving
-            if self.move_in_progress and all_stopped:
-                self.move_in_progress = False
-                
-                # No automatic chain merges - only user-initiated moves
-                
-                # Check if any tile has reached or exceeded the target value
-                self.check_level_completion()
-                
-                # Check if there are only two different tiles left
-                if self.check_low_tile_count():
-                    # Tiles were added, no need to add more
-                    pass
-                # Add exactly one new tile after every move
-                elif self.add_new_tile_after_move:
-                    # Always add exactly 1 tile
-                    self.add_random_tile()
-                    self.add_new_tile_after_move = False
-                    
-                    # Check again for level completion after adding a new tile
-                    self.check_level_completion()
-                
-                # Check for game over
-                if self.state == STATE_PLAYING and self.check_game_over():
-                    self.state = STATE_GAME_OVER
+            self.update(dt)
             
             # Handle events
             for event in pygame.event.get():
                 if event.type == QUIT:
                     running = False
+                elif event.type == VIDEORESIZE:
+                    self.resize(event.w, event.h)
                 elif event.type == MOUSEBUTTONDOWN:
-                    # Get grid coordinates from mouse position
-                    mouse_pos = pygame.mouse.get_pos()
-                    
-                    # Convert mouse position to grid coordinates
-                    grid_x = (mouse_pos[0] - MARGIN) // (CELL_SIZE + MARGIN)
-                    grid_y = (mouse_pos[1] - MARGIN) // (CELL_SIZE + MARGIN)
+                    # Convert mouse position to grid coordinates for the current layout
+                    cell = self.layout.cell_at(event.pos)
                     
                     # Check if click is within grid bounds
-                    if (0 <= grid_x < GRID_SIZE and 0 <= grid_y < GRID_SIZE and 
-                        not self.move_in_progress):
-                        self.select_tile(grid_y, grid_x)
+                    if cell and not self.move_in_progress:
+                        self.select_tile(*cell)
                             
                 elif event.type == KEYDOWN:
-                    if self.state == STATE_LEVEL_COMPLETE and event.key == K_SPACE:
+                    if event.key == K_z:  # Undo last move
+                        self.undo()
+                    elif event.key == K_t:  # Switch between light and dark themes
+                        self.cycle_theme()
+                    elif event.key == K_y:  # Redo undone move
+                        self.redo()
+                    elif self.state == STATE_LEVEL_COMPLETE and event.key == K_SPACE:
                         self.advance_level()
                     elif self.state == STATE_GAME_OVER and event.key == K_SPACE:
-                        self.__init__()  # Restart game
+                        self.__init__(telemetry=self.telemetry, theme=self.theme.name,
+                                      recorder=self.recorder,
+                                      target_policy=self.target_policy,
+                                      profiler=self.profiler,
+                                      puzzles=self.puzzles)  # Restart game
                     elif self.state == STATE_PLAYING and not self.move_in_progress:
                         if event.key == K_UP:
                             self.move_selected_tile("up")
@@ -852,14 +1818,128 @@ class Game:
                         elif event.key == K_c:  # Check for chain merges manually
                             self.check_for_chain_merges()
                         elif event.key == K_r:  # Restart level
+                            self.log_event("restart_level", level=self.level)
                             self.initialize_grid()
             
             self.draw()
+            if self.profiler:
+                self.profiler.on_frame(self)
             self.clock.tick(60)
 
+        if self.telemetry:
+            self.telemetry.close()
+        if self.recorder:
+            self.recorder.close()
+        if self.target_policy:
+            self.target_policy.shutdown()
+        if self.profiler:
+            self.profiler.export()
         pygame.quit()
         sys.exit()
 
-if __name__ == "__main__":
-    game = Game()
+def read_session(log_path, session=None):
+    """Return the events of one session from a telemetry log (the first by default)"""
+    events = []
+    with open(log_path, "r", encoding="utf-8") as log_file:
+        for line in log_file:
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            if event["event"] == "session_start" and events and session is None:
+                break  # Only the first session was asked for
+            if session is None or event.get("session") == session:
+                events.append(event)
+    return events
+
+def replay_session(events, recorder=None, theme=DEFAULT_THEME):
+    """Replay logged events as fast as possible, rendering every frame
+
+    Animations advance by a fixed REPLAY_FRAME_TIME per frame instead of the
+    wall clock, so the output looks like real-time play however fast it runs.
+    Returns the finished Game.
+    """
+    if not events or events[0]["event"] != "session_start":
+        raise ValueError("Replay needs a session_start event first")
+    game = Game(seed=events[0]["seed"], theme=theme, recorder=recorder)
+    game.draw()
+    
+    for event in events[1:]:
+        kind = event["event"]
+        if kind == "move":
+            game.select_tile(event["row"], event["col"])
+            game.move_selected_tile(event["direction"])
+        elif kind == "target":
+            game.advance_level(event["target"])
+        elif kind == "undo":
+            game.undo()
+        elif kind == "redo":
+            game.redo()
+        elif kind == "restart_level":
+            game.initialize_grid()
+        elif kind == "puzzle":
+            game.load_puzzle(tuple(event["board"]), event["target"])
+        else:
+            continue  # Derived events (evictions, level completions, ...)
+        
+        # Render until the move has played out
+        game.update(REPLAY_FRAME_TIME)
+        game.draw()
+        while game.animating():
+            game.update(REPLAY_FRAME_TIME)
+            game.draw()
+    return game
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tile Merger Puzzle")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="random seed for a reproducible game")
+    parser.add_argument("--telemetry", metavar="PATH", default=None,
+                        help="append game events to a JSON lines log")
+    parser.add_argument("--theme", choices=sorted(THEMES), default=DEFAULT_THEME,
+                        help="board color theme (press T to switch while playing)")
+    parser.add_argument("--adaptive-targets", action="store_true",
+                        help="pick each level's target from simulated playouts")
+    parser.add_argument("--target-workers", type=int, default=None,
+                        help="playout processes for --adaptive-targets (default: one per CPU but one)")
+    parser.add_argument("--profile-memory", metavar="REPORT", default=None,
+                        help="track allocations and surfaces, writing a JSON report on exit")
+    parser.add_argument("--record", metavar="PATH", default=None,
+                        help="capture frames to a directory of PNGs or a raw RGB24 file")
+    parser.add_argument("--record-format", choices=("png", "raw"), default="png")
+    parser.add_argument("--puzzles", metavar="INDEX", default=None,
+                        help="start levels from a puzzle index built by puzzle_generator.py")
+    parser.add_argument("--replay", metavar="LOG", default=None,
+                        help="render a logged session headless, as fast as possible")
+    parser.add_argument("--session", default=None,
+                        help="session id to replay (default: the first in the log)")
+    args = parser.parse_args(argv)
+
+    if args.replay:
+        # No window: switch SDL to its offscreen driver before the display opens
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+        pygame.display.quit()
+        pygame.display.init()
+        recorder = (FrameRecorder(args.record, args.record_format, block=True)
+                    if args.record else None)
+        started = time.time()
+        replay_session(read_session(args.replay, args.session), recorder, args.theme)
+        if recorder:
+            recorder.close()
+            print(f"{recorder.frames} frames written to {args.record} "
+                  f"in {time.time() - started:.1f}s")
+        return
+
+    # The playout workers start before the recorder's encoder threads
+    target_policy = TargetEstimator(args.target_workers) if args.adaptive_targets else None
+    recorder = FrameRecorder(args.record, args.record_format) if args.record else None
+    telemetry = TelemetryLog(args.telemetry) if args.telemetry else None
+    profiler = MemoryProfiler(args.profile_memory) if args.profile_memory else None
+    puzzles = PuzzleIndex(args.puzzles) if args.puzzles else None
+    if profiler:
+        logging.basicConfig(level=logging.INFO)
+    game = Game(seed=args.seed, telemetry=telemetry, theme=args.theme, recorder=recorder,
+                target_policy=target_policy, profiler=profiler, puzzles=puzzles)
     game.run()
+
+if __name__ == "__main__":
+    main()
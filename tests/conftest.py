@@ -0,0 +1,47 @@
+import os
+import random
+import sys
+
+import pytest
+
+# The game module opens a window, so run everything headless
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from board_rules import GRID_SIZE, board_moves
+
+DIRECTION_NAMES = {(-1, 0): "up", (1, 0): "down", (0, -1): "left", (0, 1): "right"}
+
+def random_board(rng, min_tiles=2, max_tiles=16, max_exponent=6):
+    """A board with a random number of random power of 2 tiles"""
+    cells = [0] * (GRID_SIZE * GRID_SIZE)
+    for index in rng.sample(range(len(cells)), rng.randint(min_tiles, max_tiles)):
+        cells[index] = 1 << rng.randint(1, max_exponent)
+    return tuple(cells)
+
+def play_step(game, rng):
+    """Advance a Game by one undoable step: a random legal move or the next level
+
+    Returns False when no step is possible (game over).
+    """
+    from sliding_tiles_2048 import STATE_LEVEL_COMPLETE, STATE_PLAYING
+    if game.state == STATE_LEVEL_COMPLETE:
+        game.advance_level()
+    elif game.state == STATE_PLAYING:
+        moves = list(board_moves(game.board_values()))
+        if not moves:
+            return False
+        index, dest = rng.choice(moves)
+        (row, col), (dest_row, dest_col) = divmod(index, GRID_SIZE), divmod(dest, GRID_SIZE)
+        game.select_tile(row, col)
+        game.move_selected_tile(DIRECTION_NAMES[(dest_row - row, dest_col - col)])
+        while game.animating():
+            game.update(1 / 60)
+    else:
+        return False
+    return True
+
+@pytest.fixture
+def rng():
+    return random.Random(2048)
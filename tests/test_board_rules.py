@@ -0,0 +1,71 @@
+import os
+import subprocess
+import sys
+
+import board_rules
+from board_rules import (
+    PositionHasher,
+    SPAWN_PRESERVING_SYMMETRIES,
+    SYMMETRIES,
+    SYMMETRY_PERMUTATIONS,
+    apply_board_move,
+    board_hash,
+    board_moves,
+    board_spawn_outcomes,
+    canonical_board,
+    canonical_hash,
+    transform_board,
+)
+from conftest import random_board
+
+def outcome_distribution(outcomes, symmetry="identity"):
+    """Merge (probability, board) pairs into {board: probability}"""
+    merged = {}
+    for probability, board in outcomes:
+        board = transform_board(board, symmetry)
+        merged[board] = round(merged.get(board, 0) + probability, 9)
+    return merged
+
+def test_spawn_preserving_symmetries_play_out_alike(rng):
+    for _ in range(500):
+        board = random_board(rng, min_tiles=11, max_exponent=4)
+        for symmetry in SPAWN_PRESERVING_SYMMETRIES:
+            permutation = SYMMETRY_PERMUTATIONS[symmetry]
+            image = transform_board(board, symmetry)
+            for index, dest in board_moves(board):
+                moved, merged = apply_board_move(board, index, dest)
+                moved_image, _ = apply_board_move(image, permutation[index], permutation[dest])
+                outcomes = board_spawn_outcomes(moved, None if merged else dest)
+                image_outcomes = board_spawn_outcomes(moved_image, None if merged else permutation[dest])
+                assert (outcome_distribution(outcomes, symmetry) ==
+                        outcome_distribution(image_outcomes))
+
+def test_canonical_hash_is_hash_of_canonical_board(rng):
+    for _ in range(300):
+        board = random_board(rng)
+        for spawn_preserving in (False, True):
+            expected = board_hash(canonical_board(board, spawn_preserving))
+            assert canonical_hash(board, spawn_preserving) == expected
+            symmetries = SPAWN_PRESERVING_SYMMETRIES if spawn_preserving else SYMMETRIES
+            for symmetry in symmetries:
+                assert canonical_hash(transform_board(board, symmetry), spawn_preserving) == expected
+
+def test_incremental_hashes_match_from_scratch(rng):
+    hasher = PositionHasher()
+    board = [0] * 16
+    for _ in range(500):
+        index = rng.randrange(16)
+        value = rng.choice((0, 2, 4, 8, 1 << 40))
+        hasher.update(index // 4, index % 4, board[index], value)
+        board[index] = value
+        assert hasher.hash == board_hash(tuple(board))
+        assert hasher.canonical_hash(tuple(board)) == canonical_hash(tuple(board))
+
+def test_hashes_agree_across_processes():
+    board = (2, 0, 0, 0, 0, 4, 0, 0, 0, 0, 0, 0, 0, 0, 0, 8)
+    script = ("import board_rules; board_rules.board_hash((4,) * 16); "
+              "print(board_rules.board_hash(%r))" % (board,))
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(board_rules.__file__)),
+                            check=True)
+    assert int(result.stdout) == board_hash(board)
@@ -0,0 +1,47 @@
+import pytest
+
+from board_rules import board_hash
+from conftest import play_step
+from sliding_tiles_2048 import Game, GameHistory
+
+@pytest.fixture
+def game(rng):
+    """A game whose short history has been trimmed at least once"""
+    game = Game(seed=7)
+    game.history = GameHistory(checkpoint_interval=4, limit=10)
+    game.states = {game.history.position: game.snapshot()}
+    while game.history.position < 30 and play_step(game, rng):
+        game.states[game.history.position] = game.snapshot()
+    assert game.history.position == 30
+    assert game.history.offset > 0
+    return game
+
+def test_undo_and_redo_restore_every_stored_move(game):
+    history = game.history
+    while game.undo():
+        assert game.snapshot() == game.states[history.position]
+        assert game.position_hash() == board_hash(game.board_values())
+    assert history.position == history.offset
+
+    while game.redo():
+        assert game.snapshot() == game.states[history.position]
+    assert history.position == 30
+
+def test_seek_reaches_every_stored_move(game, rng):
+    history = game.history
+    positions = list(range(history.offset, history.offset + len(history.records) + 1))
+    rng.shuffle(positions)
+    for position in positions:
+        assert history.seek(game, position)
+        assert game.snapshot() == game.states[position]
+        assert game.position_hash() == board_hash(game.board_values())
+    assert not history.seek(game, history.offset - 1)
+
+def test_new_move_discards_redo(game, rng):
+    for _ in range(3):
+        game.undo()
+    before = game.snapshot()
+    assert play_step(game, rng)
+    assert not game.history.can_redo()
+    assert game.undo()
+    assert game.snapshot() == before
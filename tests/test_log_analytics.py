@@ -0,0 +1,86 @@
+import json
+
+from conftest import play_step
+from log_analytics import LogStats, UndoStack, analyze
+from sliding_tiles_2048 import Game, TelemetryLog
+
+def session(events, name="s1"):
+    """Events of one session, with the fields TelemetryLog adds"""
+    return [dict(event, session=name) for event in
+            [{"event": "session_start", "seed": 1}] + events]
+
+def move(level=1):
+    return {"event": "move", "level": level}
+
+def stats_for(*sessions):
+    stats = LogStats()
+    for events in sessions:
+        for event in events:
+            stats.update(event)
+    stats.finish()
+    return stats
+
+def test_undone_steps_are_not_counted():
+    stats = stats_for(session([
+        move(), {"event": "evict", "level": 1, "value": 2},
+        move(), {"event": "undo", "level": 1},
+        move(), {"event": "evict", "level": 1, "value": 4},
+        {"event": "undo", "level": 1}, {"event": "redo", "level": 1},
+        {"event": "level_complete", "level": 1, "time": 3.0, "best_time": 3.0},
+        {"event": "target", "level": 2, "target": 128, "previous_target": 64},
+        {"event": "undo", "level": 1},
+    ]))
+    assert stats.moves == {1: 2}
+    assert stats.evictions == {(1, 2): 1, (1, 4): 1}
+    assert stats.level_times[1].count == 1
+    assert stats.targets == {}
+    assert stats.undos == {1: 3}
+    assert stats.redos == {1: 1}
+
+def test_new_step_discards_redo():
+    stats = stats_for(session([
+        move(), move(), {"event": "undo", "level": 1}, move(), {"event": "redo", "level": 1},
+    ]))
+    assert stats.moves == {1: 2}
+
+def test_restart_and_puzzle_make_earlier_steps_final():
+    for kind in ("restart_level", "puzzle"):
+        stats = stats_for(session([
+            move(), {"event": kind, "level": 1}, {"event": "undo", "level": 1},
+        ]))
+        assert stats.moves == {1: 1}
+
+def test_steps_past_the_undo_limit_are_counted():
+    stack = UndoStack(limit=2)
+    assert stack.record(move()) is None
+    assert stack.record(move()) is None
+    assert stack.record({"event": "evict", "level": 1, "value": 2}) is None
+    oldest = stack.record(move())
+    assert oldest == [move()]
+    assert len(stack.done) == 2
+
+def test_shards_merge_to_the_same_totals():
+    first = session([move(), move(), {"event": "undo", "level": 1}], "a")
+    second = session([move(2), {"event": "game_over", "level": 2}], "b")
+    merged = stats_for(first).merge(stats_for(second))
+    together = stats_for(first, second)
+    assert merged.tables() == together.tables()
+
+def test_net_counts_match_the_game_history(tmp_path, rng):
+    path = str(tmp_path / "games.jsonl")
+    telemetry = TelemetryLog(path)
+    game = Game(seed=11, telemetry=telemetry)
+    for _ in range(600):
+        if rng.random() < 0.3 and game.undo():
+            if rng.random() < 0.3:
+                game.redo()
+        elif not play_step(game, rng) and not game.undo():
+            break
+    telemetry.close()
+
+    stats = analyze([path])
+    with open(path, encoding="utf-8") as log_file:
+        kinds = [json.loads(line)["event"] for line in log_file]
+    assert kinds.count("undo") > 0 and game.level > 1
+    assert sum(stats.moves.values()) + sum(stats.targets.values()) == game.history.position
+    assert sum(stats.targets.values()) == game.level - 1
@@ -0,0 +1,65 @@
+import struct
+
+import pytest
+
+import puzzle_generator
+from board_rules import canonical_board
+from puzzle_generator import (
+    HEADER_FORMAT,
+    INDEX_MAGIC,
+    RECORD_SIZE,
+    PuzzleIndex,
+    build_index,
+    dedupe_spool,
+    solution_depth,
+)
+
+def test_dedupe_spool_sorts_and_drops_duplicates(tmp_path, rng, monkeypatch):
+    # Small runs so the merge of several sorted runs is exercised
+    monkeypatch.setattr(puzzle_generator, "SORT_RUN_RECORDS", 7)
+    records = [bytes([rng.randrange(3), rng.randrange(3)]) + bytes(RECORD_SIZE - 2)
+               for _ in range(200)]
+    spool = tmp_path / "spool"
+    spool.write_bytes(b"".join(records))
+
+    count = dedupe_spool(str(spool))
+
+    data = spool.read_bytes()
+    stored = [data[i:i + RECORD_SIZE] for i in range(0, len(data), RECORD_SIZE)]
+    assert stored == sorted(set(records))
+    assert count == len(stored)
+
+def test_dedupe_spool_handles_an_empty_spool(tmp_path):
+    spool = tmp_path / "spool"
+    spool.write_bytes(b"")
+    assert dedupe_spool(str(spool)) == 0
+    assert spool.read_bytes() == b""
+
+def test_index_puzzles_are_unique_and_reverify(tmp_path):
+    path = str(tmp_path / "puzzles.idx")
+    counts = build_index(path, [16, 32], 300, max_depth=3, workers=1, seed=1, chunk_size=100)
+    assert sum(counts.values()) > 0
+
+    with PuzzleIndex(path) as index:
+        assert len(index) == sum(counts.values())
+        boards = set()
+        for (target, difficulty), count in counts.items():
+            assert index.count(target, difficulty) == count
+            for position in range(count):
+                board = index.get(target, difficulty, position)
+                assert board == canonical_board(board, spawn_preserving=True)
+                assert solution_depth(board, target, difficulty) == difficulty
+                boards.add((target, board))
+        assert len(boards) == len(index)
+
+        board, difficulty = index.random_puzzle(16)
+        assert (16, board) in boards
+        assert index.random_puzzle(4096) is None
+        with pytest.raises(IndexError):
+            index.get(16, difficulty, index.count(16, difficulty))
+
+def test_index_rejects_other_versions(tmp_path):
+    path = tmp_path / "old.idx"
+    path.write_bytes(HEADER_FORMAT.pack(INDEX_MAGIC, 1, RECORD_SIZE, 0) + struct.pack("<Q", 0))
+    with pytest.raises(ValueError):
+        PuzzleIndex(str(path))